@@ -0,0 +1,53 @@
+import sys
+import asyncio
+import threading
+from typing import Optional
+
+
+class AsyncConsole:
+    """Reads stdin on a background thread so prompts can be awaited without blocking the event loop.
+
+    Lines typed while no prompt is waiting are kept and returned by the next prompt.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self._lines: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._thread is not None and self._loop is loop:
+            return
+        if self._thread is not None:
+            raise RuntimeError("AsyncConsole is already reading for another event loop")
+
+        self._loop = loop
+        self._lines = asyncio.Queue()
+        self._thread = threading.Thread(target=self._read_lines, name="console-reader", daemon=True)
+        self._thread.start()
+
+    def _read_lines(self):
+        for line in self.stream:
+            self._loop.call_soon_threadsafe(self._lines.put_nowait, line.rstrip("\n"))
+        # End of input
+        self._loop.call_soon_threadsafe(self._lines.put_nowait, None)
+
+    async def ainput(self, prompt: str = "") -> str:
+        """Awaitable replacement for input(); raises EOFError when stdin is closed"""
+        self._start()
+        print(prompt, end="", flush=True)
+        line = await self._lines.get()
+        if line is None:
+            # Keep reporting EOF to later prompts too
+            self._lines.put_nowait(None)
+            raise EOFError
+        return line
+
+
+console = AsyncConsole()
+
+
+async def ainput(prompt: str = "") -> str:
+    return await console.ainput(prompt)
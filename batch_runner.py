@@ -0,0 +1,217 @@
+"""
+Headless batch runner: executes browser tasks from a JSONL file across concurrent agents.
+
+Each input line is a JSON object:
+    {"task": "Go to example.com and ...", "model_id": "1", "id": "optional-id",
+     "settings": {"reset_policy": "clear_cookies", "fallback_models": ["3"], "route_mode": "fallback",
+                  "budget": {"max_steps": 30, "max_cost": 0.5}}}
+
+Results are appended to the output JSONL as each task finishes. The output file
+doubles as the checkpoint: on restart, lines that already have a result are
+skipped, so a crash does not redo finished work.
+
+Usage:
+    python batch_runner.py tasks.jsonl -o results.jsonl -w 4
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import inspect
+import argparse
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from main import BrowserAutomation, LLMManager
+from browser_pool import BrowserContextPool
+
+logger = logging.getLogger(__name__)
+
+# run_task arguments that are managed by the runner and cannot be set per task
+_RESERVED_SETTINGS = {"self", "task", "model_id", "message_queue", "screenshot_queue", "stream_steps", "context"}
+
+
+def load_checkpoint(output_path: str, retry_failed: bool = False) -> Set[int]:
+    """Line numbers that already have a result in the output file"""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+
+    with open(output_path, "r") as f:
+        for raw in f:
+            try:
+                record = json.loads(raw)
+            except json.JSONDecodeError:
+                # A crash can leave a partially written last line behind
+                continue
+            if record.get("status") in ("done", "stopped") or (record.get("status") == "failed" and not retry_failed):
+                finished.add(record["line"])
+    return finished
+
+
+def iter_tasks(input_path: str, skip: Set[int]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Stream (line number, task spec) pairs from the input JSONL without loading it all"""
+    with open(input_path, "r") as f:
+        for line_no, raw in enumerate(f, start=1):
+            if line_no in skip or not raw.strip():
+                continue
+            try:
+                spec = json.loads(raw)
+            except json.JSONDecodeError as e:
+                yield line_no, {"_error": f"Invalid JSON: {e}"}
+                continue
+            if not isinstance(spec, dict):
+                spec = {"_error": f"Task spec must be a JSON object, got {type(spec).__name__}"}
+            yield line_no, spec
+
+
+class BatchRunner:
+    """Runs task specs on N workers sharing one BrowserAutomation and appends results to a JSONL file"""
+
+    def __init__(self, automation: BrowserAutomation, output_path: str, workers: int = 2,
+                 default_model: Optional[str] = None):
+        self.automation = automation
+        self.output_path = output_path
+        self.workers = workers
+        self.default_model = default_model
+        self.counts = {"done": 0, "stopped": 0, "failed": 0}
+        self._write_lock = asyncio.Lock()
+        self._allowed_settings = set(inspect.signature(automation.run_task).parameters) - _RESERVED_SETTINGS
+
+    async def _write_result(self, record: Dict[str, Any]):
+        async with self._write_lock:
+            with open(self.output_path, "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.counts[record["status"]] += 1
+
+    def _validate(self, spec: Dict[str, Any]) -> Optional[str]:
+        if "_error" in spec:
+            return spec["_error"]
+        if not str(spec.get("task", "")).strip():
+            return "Task cannot be empty"
+        model_id = str(spec.get("model_id") or self.default_model or "")
+        if model_id not in LLMManager.MODELS:
+            return f"Invalid model ID: {model_id}"
+        if not LLMManager.check_api_key(model_id):
+            return f"Invalid or missing API key for {LLMManager.MODELS[model_id]['name']}"
+        unknown = set(spec.get("settings") or {}) - self._allowed_settings
+        if unknown:
+            return f"Unsupported settings: {', '.join(sorted(unknown))}"
+        return None
+
+    async def _run_one(self, line_no: int, spec: Dict[str, Any], queued_at: float):
+        started = time.monotonic()
+        record = {
+            "line": line_no,
+            "id": spec.get("id"),
+            "task": spec.get("task"),
+            "model_id": str(spec.get("model_id") or self.default_model or ""),
+            "started_at": datetime.now().isoformat(),
+            "queue_wait_seconds": round(started - queued_at, 3),
+        }
+
+        error = self._validate(spec)
+        if error:
+            record.update(status="failed", error=error, duration_seconds=0)
+            await self._write_result(record)
+            return
+
+        try:
+            artifacts = await self.automation.run_task(
+                spec["task"], record["model_id"], stream_steps=False, **(spec.get("settings") or {}))
+            metadata = artifacts.metadata
+            timings = metadata.get("timings") or {}
+            record.update(
+                status=metadata.get("status", "done"),
+                stop_reason=metadata.get("stop_reason"),
+                result=metadata.get("final_result"),
+                steps=metadata.get("steps"),
+                input_tokens=timings.get("input_tokens"),
+                output_tokens=timings.get("output_tokens"),
+                cost=timings.get("cost"),
+                task_id=artifacts.task_id,
+                artifacts=str(artifacts.path),
+            )
+        except Exception as e:
+            record.update(status="failed", error=str(e))
+        record["duration_seconds"] = round(time.monotonic() - started, 3)
+        await self._write_result(record)
+        logger.info(f"Line {line_no}: {record['status']} in {record['duration_seconds']}s")
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await self._run_one(*item)
+            finally:
+                queue.task_done()
+
+    async def run(self, tasks: Iterator[Tuple[int, Dict[str, Any]]]):
+        """Feed tasks to the workers through a bounded queue so the input is streamed"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        try:
+            for line_no, spec in tasks:
+                await queue.put((line_no, spec, time.monotonic()))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+async def run_batch(args: argparse.Namespace):
+    finished = load_checkpoint(args.output, retry_failed=args.retry_failed)
+    if finished:
+        print(f"Resuming: skipping {len(finished)} line(s) already in {args.output}")
+
+    pool = BrowserContextPool.from_env(max_contexts=args.workers)
+    automation = BrowserAutomation(pool=pool)
+    runner = BatchRunner(automation, args.output, workers=args.workers, default_model=args.model)
+
+    started = time.monotonic()
+    try:
+        await runner.run(iter_tasks(args.input, finished))
+    finally:
+        await automation.cleanup()
+
+    elapsed = time.monotonic() - started
+    print(f"Batch finished in {elapsed:.1f}s: {runner.counts['done']} done, "
+          f"{runner.counts['stopped']} stopped by budget, {runner.counts['failed']} failed. "
+          f"Results in {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run browser automation tasks from a JSONL file")
+    parser.add_argument("input", help="JSONL file with one task per line")
+    parser.add_argument("-o", "--output", help="JSONL file for results and checkpoints (default: <input>.results.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=int(os.getenv("BROWSER_MAX_CONTEXTS", "2")),
+                        help="Number of concurrent agents")
+    parser.add_argument("-m", "--model", help="Model ID for lines that do not set model_id")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-run lines that previously failed")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"❌ Input file not found: {args.input}")
+        sys.exit(1)
+    if args.workers < 1:
+        print("❌ --workers must be at least 1")
+        sys.exit(1)
+    args.output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+
+    try:
+        asyncio.run(run_batch(args))
+    except KeyboardInterrupt:
+        print("\nBatch interrupted; re-run the same command to resume")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Startup-time benchmark for main.py.
+
+Imports main in a fresh interpreter with `python -X importtime`, prints the
+slowest imports and fails if startup exceeds a time budget or pulls in a
+module that should only be loaded on demand (provider SDKs, browser_use, gradio).
+
+Usage:
+    python bench_startup.py                  # report
+    python bench_startup.py --max-ms 800     # fail if importing main takes longer
+"""
+
+import re
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+# Modules that main.py must not import at startup
+DEFERRED_MODULES = [
+    "langchain_google_genai",
+    "langchain_anthropic",
+    "langchain_openai",
+    "browser_use",
+    "gradio",
+    "pyperclip",
+]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str = "main") -> Tuple[List[Tuple[str, int, int, int]], int]:
+    """Return ([(name, self_us, cumulative_us, depth)], total_us) for importing module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+    total = next((cumulative for name, _, cumulative, _ in entries if name == module), 0)
+    return entries, total
+
+
+def direct_imports(entries: List[Tuple[str, int, int, int]], module: str) -> Dict[str, int]:
+    """Cumulative time of each top-level package imported (directly) by module"""
+    # -X importtime prints children before their parent, one indent level deeper
+    end = next(i for i, (name, _, _, depth) in enumerate(entries) if name == module and depth == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+
+    breakdown: Dict[str, int] = {}
+    for name, _, cumulative, depth in entries[start:end]:
+        if depth == 1:
+            package = name.split(".")[0]
+            breakdown[package] = breakdown.get(package, 0) + cumulative
+    return breakdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of main.py")
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to show")
+    parser.add_argument("--max-ms", type=float, help="Fail if the import takes longer than this")
+    args = parser.parse_args()
+
+    entries, total_us = measure(args.module)
+
+    print(f"\nImport time of {args.module}: {total_us / 1000:.1f} ms\n")
+    print(f"{'cumulative ms':>14}  package")
+    breakdown = sorted(direct_imports(entries, args.module).items(), key=lambda item: item[1], reverse=True)
+    for package, cumulative in breakdown[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {package}")
+
+    failures = []
+    loaded = {name.split(".")[0] for name, _, _, _ in entries}
+    eager = [module for module in DEFERRED_MODULES if module in loaded]
+    if eager:
+        failures.append(f"Modules imported at startup that should be deferred: {', '.join(eager)}")
+    if args.max_ms is not None and total_us / 1000 > args.max_ms:
+        failures.append(f"Startup took {total_us / 1000:.1f} ms, budget is {args.max_ms:.1f} ms")
+
+    for failure in failures:
+        print(f"\n❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("\n✅ Startup within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import metrics
+
+if TYPE_CHECKING:
+    # browser_use is imported on first launch to keep startup fast
+    from browser_use.browser.browser import Browser, BrowserConfig
+    from browser_use.browser.context import BrowserContext, BrowserContextConfig
+
+logger = logging.getLogger(__name__)
+
+# What happens to a context when it is returned to the pool
+RESET_KEEP_SESSION = "keep_session"      # keep cookies, storage and open pages
+RESET_CLEAR_COOKIES = "clear_cookies"    # drop cookies and go back to a blank page
+RESET_RECREATE = "recreate"              # close the context and warm up a new one
+RESET_POLICIES = (RESET_KEEP_SESSION, RESET_CLEAR_COOKIES, RESET_RECREATE)
+
+# Chromium flags for many contexts on a server: no GPU, no background services, no audio
+THROUGHPUT_CHROMIUM_ARGS = [
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--disable-extensions",
+    "--disable-component-update",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--hide-scrollbars",
+]
+
+# URL patterns per blockable resource type, for CDP Network.setBlockedURLs
+_RESOURCE_URL_EXTENSIONS = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "ogg", "ogv", "mp3", "wav", "m4a", "aac", "mov", "m3u8"),
+    "stylesheet": ("css",),
+}
+
+# JS heap of a context's pages, summed; precise with --enable-precise-memory-info
+_JS_HEAP_BYTES_JS = "() => performance.memory ? performance.memory.usedJSHeapSize : 0"
+
+
+class LaunchSettings:
+    """How the pool launches browsers and sets up contexts; None or empty leaves a setting at the browser default"""
+
+    def __init__(self, headless: bool = True, block_resources: Tuple[str, ...] = (),
+                 viewport: Optional[Tuple[int, int]] = None, cache_dir: Optional[str] = None,
+                 cache_mb: int = 256, max_context_memory_mb: Optional[int] = None):
+        self.headless = headless
+        unknown = set(block_resources) - set(_RESOURCE_URL_EXTENSIONS)
+        if unknown:
+            raise ValueError(f"Cannot block resource type(s): {', '.join(sorted(unknown))}")
+        self.block_resources = tuple(block_resources)
+        self.viewport = viewport
+        self.cache_dir = cache_dir
+        self.cache_mb = cache_mb
+        self.max_context_memory_mb = max_context_memory_mb
+
+    @classmethod
+    def from_env(cls) -> "LaunchSettings":
+        """Settings from BROWSER_HEADLESS, BROWSER_BLOCK_RESOURCES, BROWSER_VIEWPORT, BROWSER_CACHE_DIR,
+        BROWSER_CACHE_MB and BROWSER_CONTEXT_MAX_MB"""
+        viewport = os.getenv("BROWSER_VIEWPORT", "1024x768").strip()
+        max_memory = os.getenv("BROWSER_CONTEXT_MAX_MB", "512").strip()
+        return cls(
+            headless=os.getenv("BROWSER_HEADLESS", "true").strip().lower() in ("1", "true", "yes"),
+            block_resources=tuple(r.strip() for r in os.getenv("BROWSER_BLOCK_RESOURCES", "font,media").split(",")
+                                  if r.strip()),
+            viewport=tuple(int(v) for v in viewport.lower().split("x")) if viewport else None,
+            cache_dir=os.getenv("BROWSER_CACHE_DIR", ".browser_cache").strip() or None,
+            cache_mb=int(os.getenv("BROWSER_CACHE_MB", "256")),
+            max_context_memory_mb=int(max_memory) if max_memory and int(max_memory) > 0 else None,
+        )
+
+    def blocked_url_patterns(self) -> List[str]:
+        """URL patterns for the blocked resource types, with and without a query string"""
+        patterns = []
+        for resource_type in self.block_resources:
+            for extension in _RESOURCE_URL_EXTENSIONS[resource_type]:
+                patterns += [f"*.{extension}", f"*.{extension}?*"]
+        return patterns
+
+    def chromium_args(self, browser_index: int = 0) -> List[str]:
+        args = list(THROUGHPUT_CHROMIUM_ARGS)
+        if self.cache_dir:
+            # One directory per browser: Chromium's disk cache cannot be opened by two processes at once
+            cache_path = os.path.abspath(os.path.join(self.cache_dir, f"browser-{browser_index}"))
+            args += [f"--disk-cache-dir={cache_path}", f"--disk-cache-size={self.cache_mb * 1024 * 1024}"]
+        if self.max_context_memory_mb:
+            # V8 heap ceiling per renderer: a runaway page crashes its tab instead of exhausting the host
+            args += [f"--js-flags=--max-old-space-size={self.max_context_memory_mb}", "--enable-precise-memory-info"]
+        return args
+
+    def browser_config(self, browser_index: int = 0, **overrides) -> "BrowserConfig":
+        from browser_use.browser.browser import BrowserConfig
+
+        settings = {"headless": self.headless, "extra_chromium_args": self.chromium_args(browser_index)}
+        settings.update(overrides)
+        return BrowserConfig(**settings)
+
+    def context_config(self) -> Optional["BrowserContextConfig"]:
+        if not self.viewport:
+            return None
+        from browser_use.browser.context import BrowserContextConfig
+
+        width, height = self.viewport
+        return BrowserContextConfig(browser_window_size={"width": width, "height": height})
+
+
+class BrowserContextPool:
+    """Bounded pool of pre-warmed browser contexts spread over one or more browsers.
+
+    Contexts are checked out with acquire()/release() or the lease() context
+    manager. At most max_contexts contexts are leased at any time; further
+    callers wait until one is returned.
+    """
+
+    def __init__(
+        self,
+        max_contexts: int = 2,
+        browsers: int = 1,
+        reset_policy: str = RESET_KEEP_SESSION,
+        prewarm: Optional[int] = None,
+        browser_config: Optional["BrowserConfig"] = None,
+        context_config: Optional["BrowserContextConfig"] = None,
+        settings: Optional[LaunchSettings] = None,
+    ):
+        if max_contexts < 1:
+            raise ValueError("max_contexts must be at least 1")
+        if reset_policy not in RESET_POLICIES:
+            raise ValueError(f"Invalid reset policy: {reset_policy}")
+
+        self.max_contexts = max_contexts
+        self.browser_count = max(1, min(browsers, max_contexts))
+        self.reset_policy = reset_policy
+        self.prewarm = max_contexts if prewarm is None else min(prewarm, max_contexts)
+        self.browser_config = browser_config
+        self.context_config = context_config
+        # Explicit configs take precedence; settings still apply resource blocking and the memory check
+        self.settings = settings or LaunchSettings()
+
+        self.browsers: List["Browser"] = []
+        self._idle: List["BrowserContext"] = []
+        self._leased: Dict[int, "BrowserContext"] = {}
+        self._contexts_per_browser: Dict[int, int] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._started = False
+
+    @classmethod
+    def from_env(cls, **overrides) -> "BrowserContextPool":
+        """Build a pool from BROWSER_MAX_CONTEXTS, BROWSER_POOL_BROWSERS, BROWSER_CONTEXT_RESET
+        and the launch settings in LaunchSettings.from_env"""
+        settings = {
+            "max_contexts": int(os.getenv("BROWSER_MAX_CONTEXTS", "2")),
+            "browsers": int(os.getenv("BROWSER_POOL_BROWSERS", "1")),
+            "reset_policy": os.getenv("BROWSER_CONTEXT_RESET", RESET_KEEP_SESSION),
+            "settings": LaunchSettings.from_env(),
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self):
+        """Launch the browsers and pre-warm contexts"""
+        if self._started:
+            return
+
+        from browser_use.browser.browser import Browser
+
+        started = time.perf_counter()
+        self._semaphore = asyncio.Semaphore(self.max_contexts)
+        if self.context_config is None:
+            self.context_config = self.settings.context_config()
+        for index in range(self.browser_count):
+            browser = Browser(config=self.browser_config or self.settings.browser_config(index))
+            self.browsers.append(browser)
+            self._contexts_per_browser[id(browser)] = 0
+
+        try:
+            warmed = await asyncio.gather(*(self._create_context() for _ in range(self.prewarm)))
+        except Exception:
+            await self.close()
+            raise
+        self._idle.extend(warmed)
+        self._started = True
+        metrics.BROWSER_LAUNCH_SECONDS.observe(time.perf_counter() - started)
+        logger.info(f"Browser pool started: {self.browser_count} browser(s), "
+                    f"{len(warmed)} warm context(s), max {self.max_contexts} concurrent")
+
+    async def _create_context(self) -> "BrowserContext":
+        """Create a context on the least loaded browser and open its session"""
+        browser = min(self.browsers, key=lambda b: self._contexts_per_browser[id(b)])
+        self._contexts_per_browser[id(browser)] += 1
+        started = time.perf_counter()
+        try:
+            if self.context_config:
+                context = await browser.new_context(config=self.context_config)
+            else:
+                context = await browser.new_context()
+            session = await context.get_session()
+            if self.settings.block_resources:
+                await self._install_blocking(session.context)
+            metrics.CONTEXT_CREATE_SECONDS.observe(time.perf_counter() - started)
+            return context
+        except Exception:
+            self._contexts_per_browser[id(browser)] -= 1
+            raise
+
+    async def _install_blocking(self, playwright_context):
+        """Block resource URLs in Chromium itself through CDP. Unlike Playwright routing, this keeps
+        the HTTP cache on and does not send every request through a Python handler."""
+        patterns = self.settings.blocked_url_patterns()
+
+        async def block(page):
+            try:
+                cdp = await playwright_context.new_cdp_session(page)
+                await cdp.send("Network.enable")
+                await cdp.send("Network.setBlockedURLs", {"urls": patterns})
+            except Exception as e:
+                logger.debug(f"Could not block resources on a page: {str(e)}")
+
+        for page in playwright_context.pages:
+            await block(page)
+        playwright_context.on("page", block)
+
+    async def _memory_mb(self, context: "BrowserContext") -> float:
+        """JS heap in use across the context's pages"""
+        session = await context.get_session()
+        total = 0
+        for page in session.context.pages:
+            try:
+                total += await page.evaluate(_JS_HEAP_BYTES_JS)
+            except Exception:
+                continue
+        return total / (1024 * 1024)
+
+    async def _over_memory(self, context: "BrowserContext") -> bool:
+        """Whether the context has grown past the recycle threshold (80% of the V8 ceiling)"""
+        if not self.settings.max_context_memory_mb:
+            return False
+        try:
+            used = await self._memory_mb(context)
+        except Exception:
+            return True
+        if used > self.settings.max_context_memory_mb * 0.8:
+            logger.info(f"Recycling a context using {used:.0f} MB of JS heap")
+            return True
+        return False
+
+    async def _discard_context(self, context: "BrowserContext"):
+        self._contexts_per_browser[id(context.browser)] = max(
+            0, self._contexts_per_browser.get(id(context.browser), 1) - 1)
+        try:
+            await context.close()
+        except Exception as e:
+            logger.error(f"Error closing pooled context: {str(e)}")
+
+    async def _reset_context(self, context: "BrowserContext", policy: str) -> bool:
+        """Apply the reset policy; returns False if the context should be discarded"""
+        if policy == RESET_RECREATE:
+            return False
+        if policy == RESET_CLEAR_COOKIES:
+            try:
+                session = await context.get_session()
+                await session.context.clear_cookies()
+                page = await context.get_current_page()
+                await page.goto("about:blank")
+            except Exception as e:
+                logger.warning(f"Failed to reset pooled context, discarding it: {str(e)}")
+                return False
+        return True
+
+    async def acquire(self) -> "BrowserContext":
+        """Check out a context, waiting while max_contexts are already leased"""
+        if not self._started:
+            await self.start()
+
+        await self._semaphore.acquire()
+        try:
+            context = self._idle.pop() if self._idle else await self._create_context()
+        except Exception:
+            self._semaphore.release()
+            raise
+        self._leased[id(context)] = context
+        return context
+
+    async def release(self, context: "BrowserContext", reset_policy: Optional[str] = None):
+        """Return a leased context, resetting it according to the policy"""
+        if self._leased.pop(id(context), None) is None:
+            logger.warning("Ignoring release of a context that is not leased from this pool")
+            return
+
+        try:
+            policy = reset_policy or self.reset_policy
+            keep = policy != RESET_RECREATE and not await self._over_memory(context)
+            if self._started and keep and await self._reset_context(context, policy):
+                self._idle.append(context)
+            else:
+                await self._discard_context(context)
+        finally:
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def lease(self, reset_policy: Optional[str] = None):
+        """Async context manager around acquire()/release()"""
+        context = await self.acquire()
+        try:
+            yield context
+        finally:
+            await self.release(context, reset_policy)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "browsers": len(self.browsers),
+            "idle": len(self._idle),
+            "leased": len(self._leased),
+            "max_contexts": self.max_contexts,
+        }
+
+    async def close(self):
+        """Close every context and browser owned by the pool"""
+        self._started = False
+        contexts = self._idle + list(self._leased.values())
+        self._idle.clear()
+        self._leased.clear()
+        for context in contexts:
+            await self._discard_context(context)
+        for browser in self.browsers:
+            try:
+                await browser.close()
+            except Exception as e:
+                logger.error(f"Error closing pooled browser: {str(e)}")
+        self.browsers.clear()
+        self._contexts_per_browser.clear()
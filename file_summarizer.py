@@ -1,13 +1,19 @@
 """
 Goal: Searches for job listings, evaluates relevance based on a CV, and applies 
 
-@dev You need to add OPENAI_API_KEY to your environment variables.
+@dev You need to add GOOGLE_API_KEY to your environment variables.
 Also you have to install PyPDF2 to read pdf files: pip install PyPDF2
+
+Usage: python file_summarizer.py [Company ...]
+Companies are searched in parallel, JOB_SEARCH_PARALLEL at a time.
 """
 
-import csv
+import hashlib
+import json
 import os
 import sys
+import time
+from collections import Counter
 from pathlib import Path
 import logging
 from typing import List, Optional
@@ -24,10 +30,20 @@ genai.configure(api_key="your_api_key")
 model = genai.GenerativeModel('gemini-2.0-flash-exp')
 
 from browser_use import ActionResult, Agent, Controller
-from browser_use.browser.context import BrowserContext
-from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.browser import BrowserConfig
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+import metrics
+from browser_pool import BrowserContextPool, LaunchSettings, RESET_CLEAR_COOKIES
+from job_store import JobStore
+from log_setup import setup_logging, adopt_logger, task_id_var
+from main import LLMManager
+from rate_limiter import LLMMetricsCallbackHandler
+from upload_actions import register_upload_action
 
 
+setup_logging()
+adopt_logger("browser_use")
 logger = logging.getLogger(__name__)
 # full screen mode
 controller = Controller()
@@ -48,121 +64,232 @@ class Job(BaseModel):
 	salary: Optional[str] = None
 
 
-@controller.action('Save jobs to file - with a score how well it fits to my profile', param_model=Job)
-def save_jobs(job: Job):
-	with open('jobs.csv', 'a', newline='') as f:
-		writer = csv.writer(f)
-		writer.writerow([job.title, job.company, job.link, job.link, job.location])
+# Jobs saved per company (lowercased) during this run, for the throughput report
+jobs_found = Counter()
 
-	return 'Saved job to file'
 
+class JobQuery(BaseModel):
+	company: Optional[str] = None
+	min_fit_score: Optional[float] = None
+	location: Optional[str] = None
+	limit: int = 10
 
-@controller.action('Read jobs from file')
-def read_jobs():
-	with open('jobs.csv', 'r') as f:
-		return f.read()
 
+# Saved jobs, deduplicated by link; jobs.csv from earlier runs is imported once
+job_store = JobStore(os.getenv('JOB_STORE_PATH', 'jobs.db'))
+if job_store.count() == 0 and job_store.import_csv('jobs.csv'):
+	logger.info('Imported jobs.csv into the job store')
 
-@controller.action('Read my cv for context to fill forms')
-async def read_cv():
-	pdf = PdfReader(CV)
-	text = ''
-	for page in pdf.pages:
-		text += page.extract_text() or ''
-	logger.info(f'Read cv with {len(text)} characters')
-
-	prompt = f"Summarize the following CV content: {text}"
-	response = model.generate_content(prompt)
-	try:
-		summary = response.text
-		logger.info(f"Gemini API Summary: {summary}")
-	except Exception as e:
-		summary = str(e)
-		logger.error(f"Gemini API Error: {summary}")
+# Upper bound on jobs returned to the agent, so prompt size stays constant as the store grows
+READ_JOBS_MAX = 25
 
-	return ActionResult(extracted_content=summary, include_in_memory=True)
+
+@controller.action('Save jobs to file - with a score how well it fits to my profile', param_model=Job)
+def save_jobs(job: Job):
+	jobs_found[job.company.lower()] += 1
+	job_store.add(job.model_dump())
+	return 'Saved job to file'
 
 
 @controller.action(
-	'Upload cv to element - call this function to upload if element is not found, try with different index of the same upload element',
+	'Read saved jobs - best fit first, optionally filtered by company, minimum fit score or location',
+	param_model=JobQuery,
 )
-async def upload_cv(index: int, browser: BrowserContext):
-	path = str(CV.absolute())
-	dom_el = await browser.get_dom_element_by_index(index)
+def read_jobs(query: JobQuery):
+	jobs = job_store.query(
+		company=query.company,
+		min_fit_score=query.min_fit_score,
+		location=query.location,
+		limit=max(1, min(query.limit, READ_JOBS_MAX)),
+	)
+	if not jobs:
+		return 'No saved jobs match'
+	return '\n'.join(
+		f"{j['fit_score']:.2f} | {j['title']} | {j['company']} | {j['location'] or '-'} | {j['salary'] or '-'} | {j['link']}"
+		for j in jobs
+	)
 
-	if dom_el is None:
-		return ActionResult(error=f'No element found at index {index}')
 
-	file_upload_dom_el = dom_el.get_file_upload_element()
+# Extracted CV text and summaries, keyed by the SHA-256 of the file contents
+CV_CACHE_DIR = Path.cwd() / '.cv_cache'
+_cv_hashes: dict = {}
+_cv_memory_cache: dict = {}
+_cv_lock = asyncio.Lock()
 
-	if file_upload_dom_el is None:
-		logger.info(f'No file upload element found at index {index}')
-		return ActionResult(error=f'No file upload element found at index {index}')
 
-	file_upload_el = await browser.get_locate_element(file_upload_dom_el)
+def _file_hash(path: Path) -> str:
+	"""Content hash of a file, recomputed only when its mtime or size changes"""
+	stat = path.stat()
+	key = (str(path), stat.st_mtime_ns, stat.st_size)
+	if key not in _cv_hashes:
+		digest = hashlib.sha256()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(1024 * 1024), b''):
+				digest.update(chunk)
+		_cv_hashes[key] = digest.hexdigest()
+	return _cv_hashes[key]
 
-	if file_upload_el is None:
-		logger.info(f'No file upload element found at index {index}')
-		return ActionResult(error=f'No file upload element found at index {index}')
 
+def _extract_pages(path: Path) -> List[str]:
+	return [page.extract_text() or '' for page in PdfReader(path).pages]
+
+
+def _load_cv_cache(file_hash: str) -> dict:
+	if file_hash in _cv_memory_cache:
+		return _cv_memory_cache[file_hash]
+	cache_file = CV_CACHE_DIR / f'{file_hash}.json'
 	try:
-		await file_upload_el.set_input_files(path)
-		msg = f'Successfully uploaded file "{path}" to index {index}"'
-		logger.info(msg)
-		return ActionResult(extracted_content=msg)
-	except Exception as e:
-		logger.debug(f'Error in set_input_files: {str(e)}')
-		return ActionResult(error=f'Failed to upload file to index {index}')
+		entry = json.loads(cache_file.read_text())
+	except (FileNotFoundError, json.JSONDecodeError):
+		entry = {}
+	_cv_memory_cache[file_hash] = entry
+	return entry
+
+
+def _save_cv_cache(file_hash: str, entry: dict):
+	_cv_memory_cache[file_hash] = entry
+	CV_CACHE_DIR.mkdir(exist_ok=True)
+	tmp_file = CV_CACHE_DIR / f'{file_hash}.json.tmp'
+	tmp_file.write_text(json.dumps(entry))
+	os.replace(tmp_file, CV_CACHE_DIR / f'{file_hash}.json')
+
+
+async def summarize_cv(path: Path = CV) -> str:
+	"""Return the cached CV summary, extracting and summarizing only what is missing"""
+	async with _cv_lock:
+		file_hash = await asyncio.to_thread(_file_hash, path)
+		entry = dict(_load_cv_cache(file_hash))
+
+		if 'pages' not in entry:
+			entry['pages'] = await asyncio.to_thread(_extract_pages, path)
+			_save_cv_cache(file_hash, entry)
+		text = ''.join(entry['pages'])
+		logger.info(f'Read cv with {len(text)} characters')
+
+		if 'summary' not in entry:
+			prompt = f"Summarize the following CV content: {text}"
+			try:
+				response = await model.generate_content_async(prompt)
+				entry['summary'] = response.text
+				_save_cv_cache(file_hash, entry)
+				logger.info(f"Gemini API Summary: {entry['summary']}")
+			except Exception as e:
+				# Errors are returned to the agent but not cached
+				logger.error(f"Gemini API Error: {str(e)}")
+				return str(e)
+
+		return entry['summary']
+
+
+@controller.action('Read my cv for context to fill forms')
+async def read_cv():
+	summary = await summarize_cv()
+	return ActionResult(extracted_content=summary, include_in_memory=True)
 
 
-browser = Browser(
-	config=BrowserConfig(
+# Finds the file input itself (cached per site), so uploading takes one step instead of guessing indices
+upload_cv = register_upload_action(
+	controller,
+	'Upload cv - finds the file input on the page itself; optionally pass the index of the upload button',
+	lambda: [CV],
+)
+
+
+# Parallel search settings
+COMPANIES = ['Google', 'Amazon', 'Apple', 'Microsoft', 'Meta']
+MAX_PARALLEL = int(os.getenv('JOB_SEARCH_PARALLEL', '3'))
+COMPANY_TIMEOUT = float(os.getenv('JOB_SEARCH_TIMEOUT', '600'))
+COMPANY_RETRIES = int(os.getenv('JOB_SEARCH_RETRIES', '1'))
+
+# Agents share a bounded set of contexts instead of one browser tab
+pool = BrowserContextPool(
+	max_contexts=MAX_PARALLEL,
+	reset_policy=RESET_CLEAR_COOKIES,
+	browser_config=BrowserConfig(
 		chrome_instance_path='/usr/bin/chromium-browser',
 		disable_security=True,
-	)
+	),
+	# Resource blocking, viewport and memory recycling from BROWSER_* settings
+	settings=LaunchSettings.from_env(),
 )
 
 
-async def main():
-	# ground_task = (
-	# 	'You are a professional job finder. '
-	# 	'1. Read my cv with read_cv'
-	# 	'2. Read the saved jobs file '
-	# 	'3. start applying to the first link of Amazon '
-	# 	'You can navigate through pages e.g. by scrolling '
-	# 	'Make sure to be on the english version of the page'
-	# )
+async def search_company(company: str, ground_task: str, llm) -> dict:
+	"""Run one job-search agent for a company with a timeout and retries"""
+	started = time.monotonic()
+	report = {'company': company, 'status': 'failed', 'attempts': 0, 'error': None}
+	# Each company runs in its own asyncio task, so its log lines and LLM usage are tagged with the company
+	task_id_var.set(company)
+	usage = metrics.TaskMetrics()
+	metrics.current_task.set(usage)
+
+	for attempt in range(1, COMPANY_RETRIES + 2):
+		report['attempts'] = attempt
+		async with pool.lease() as context:
+			agent = Agent(
+				task=ground_task + '\n' + company,
+				llm=llm,
+				controller=controller,
+				browser=context.browser,
+				browser_context=context,
+				generate_gif=False,
+			)
+			try:
+				await asyncio.wait_for(agent.run(), timeout=COMPANY_TIMEOUT)
+				report.update(status='done', error=None)
+				break
+			except asyncio.TimeoutError:
+				report['error'] = f'Timed out after {COMPANY_TIMEOUT:.0f}s'
+			except Exception as e:
+				report['error'] = str(e)
+		logger.warning(f'{company}: attempt {attempt} failed: {report["error"]}')
+
+	report['duration'] = time.monotonic() - started
+	report['jobs'] = sum(count for name, count in jobs_found.items() if company.lower() in name)
+	# Input and output tokens priced by the model's cost_per_1k, as in the task metrics
+	report.update(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens, cost=usage.cost)
+	return report
+
+
+def print_throughput_report(reports: List[dict], elapsed: float):
+	print('\n=== Job search report ===')
+	print(f'{"Company":<15}{"Status":<10}{"Jobs":>6}{"Attempts":>10}{"Time (s)":>10}{"Tokens":>10}{"Cost ($)":>10}')
+	for r in reports:
+		print(f'{r["company"]:<15}{r["status"]:<10}{r["jobs"]:>6}{r["attempts"]:>10}'
+			  f'{r["duration"]:>10.1f}{r["input_tokens"] + r["output_tokens"]:>10}{r["cost"]:>10.4f}')
+	total_jobs = sum(r['jobs'] for r in reports)
+	slowest = max((r['duration'] for r in reports), default=0)
+	print(f'\nWall time {elapsed:.1f}s (slowest company {slowest:.1f}s), '
+		  f'{total_jobs} jobs, {total_jobs / max(elapsed / 60, 1e-9):.2f} jobs/min, '
+		  f'total cost ${sum(r["cost"] for r in reports):.4f}')
+
+
+async def main(companies: Optional[List[str]] = None):
+	companies = companies or COMPANIES
+
+	# Summarize the CV once; every agent gets the same cached summary
+	cv_summary = await summarize_cv()
 	ground_task = (
 		'You are a professional job finder. '
-		'1. Read my cv with read_cv'
-		'find ml internships in and save them to a file'
-		'search at company:'
+		f'My CV summary: {cv_summary}\n'
+		'Find ml internships that fit my profile and save them to a file. '
+		'Search at company:'
 	)
-	tasks = [
-		ground_task + '\n' + 'Google',
-		# ground_task + '\n' + 'Amazon',
-		# ground_task + '\n' + 'Apple',
-		# ground_task + '\n' + 'Microsoft',
-		# ground_task
-		# + '\n'
-		# + 'go to https://nvidia.wd5.myworkdayjobs.com/en-US/NVIDIAExternalCareerSite/job/Taiwan%2C-Remote/Fulfillment-Analyst---New-College-Graduate-2025_JR1988949/apply/autofillWithResume?workerSubType=0c40f6bd1d8f10adf6dae42e46d44a17&workerSubType=ab40a98049581037a3ada55b087049b7 NVIDIA',
-		# ground_task + '\n' + 'Meta',
-	]
-	# model = AzureChatOpenAI(
-	# 	model='gpt-4o',
-	# 	api_version='2024-10-21',
-	# 	azure_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT', ''),
-	# 	api_key=SecretStr(os.getenv('AZURE_OPENAI_KEY', '')),
-	# )
-
-	agents = []
-	# for task in tasks:
-	# 	agent = Agent(task=task, llm=model, controller=controller, browser=browser)
-	# 	agents.append(agent)
-
-	# await asyncio.gather(*[agent.run() for agent in agents])
-	await read_cv()
+	config = LLMManager.MODELS['1']  # Gemini
+	llm = ChatGoogleGenerativeAI(
+		model=config['model'],
+		google_api_key=os.getenv(config['key_env']),
+		callbacks=[LLMMetricsCallbackHandler(config['model'], config['provider'], config.get('cost_per_1k'))],
+	)
+
+	started = time.monotonic()
+	try:
+		reports = await asyncio.gather(*(search_company(company, ground_task, llm) for company in companies))
+	finally:
+		job_store.flush()
+		await pool.close()
+	print_throughput_report(reports, time.monotonic() - started)
 
 
 if __name__ == "__main__":
-	asyncio.run(main())
+	asyncio.run(main(sys.argv[1:]))
@@ -2,15 +2,16 @@ import os
 import asyncio
 from pathlib import Path
 import logging
-from browser_use import Agent, Controller, ActionResult
-from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use import Agent, Controller
+from browser_use.browser.browser import Browser
 from langchain_google_genai import ChatGoogleGenerativeAI
+from browser_pool import LaunchSettings
+from session_store import SessionStore
+from log_setup import setup_logging, adopt_logger
+from upload_actions import register_upload_action
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Constants
@@ -18,39 +19,21 @@ GOOGLE_API_KEY = "your_api_key"
 PDF_PATH = "/path/to/your/file.pdf"
 GITHUB_USERNAME = "username"
 GITHUB_PASSWORD = "password"
+GITHUB_SESSION = "github"
 
-# Initialize controller
-controller = Controller()
-
-@controller.action('Upload pdf to element')
-async def upload_pdf(index: int, browser: Browser):
-    """Upload PDF file to a specific element"""
-    path = str(Path(PDF_PATH).absolute())
-    dom_el = await browser.get_dom_element_by_index(index)
-
-    if dom_el is None:
-        return ActionResult(error=f'No element found at index {index}')
-
-    file_upload_dom_el = dom_el.get_file_upload_element()
+sessions = SessionStore()
 
-    if file_upload_dom_el is None:
-        logger.info(f'No file upload element found at index {index}')
-        return ActionResult(error=f'No file upload element found at index {index}')
+adopt_logger("browser_use")
 
-    file_upload_el = await browser.get_locate_element(file_upload_dom_el)
-
-    if file_upload_el is None:
-        logger.info(f'No file upload element found at index {index}')
-        return ActionResult(error=f'No file upload element found at index {index}')
+# Initialize controller
+controller = Controller()
 
-    try:
-        await file_upload_el.set_input_files(path)
-        msg = f'Successfully uploaded file "{path}" to index {index}'
-        logger.info(msg)
-        return ActionResult(extracted_content=msg)
-    except Exception as e:
-        logger.debug(f'Error in set_input_files: {str(e)}')
-        return ActionResult(error=f'Failed to upload file to index {index}')
+# Finds the file input itself and remembers its selector for github.com, so no index guessing
+upload_pdf = register_upload_action(
+    controller,
+    'Upload pdf to element - finds the file input on the page itself; optionally pass the index of the upload button',
+    lambda: [PDF_PATH],
+)
 
 class BrowserAutomation:
     def __init__(self):
@@ -60,12 +43,13 @@ class BrowserAutomation:
     async def initialize(self):
         """Initialize browser and context"""
         if not self.browser:
-            browser_config = BrowserConfig(
-                disable_security=True,
-                headless=False  # Set to False to see the browser
-            )
+            # Headless unless BROWSER_HEADLESS=false (to watch the upload)
+            launch = LaunchSettings.from_env()
+            browser_config = launch.browser_config(disable_security=True)
             self.browser = Browser(config=browser_config)
-            self.context = await self.browser.new_context()
+            context_config = launch.context_config()
+            self.context = await (self.browser.new_context(config=context_config) if context_config
+                                  else self.browser.new_context())
             logger.info("Browser and context initialized successfully")
 
     async def cleanup(self):
@@ -91,18 +75,28 @@ class BrowserAutomation:
                 temperature=0
             )
 
-            # Create task for GitHub upload
-            task = f"""
-            Follow these steps precisely:
+            # A saved GitHub session makes the sign-in steps unnecessary
+            if await sessions.restore(GITHUB_SESSION, self.context):
+                login_steps = """
+            1. Go to github.com (you are already signed in)
+            """
+            else:
+                login_steps = f"""
             1. Go to github.com
             2. Click "Sign in" button
             3. Enter username: {GITHUB_USERNAME}
             4. Enter password: {GITHUB_PASSWORD}
+            """
+
+            # Create task for GitHub upload
+            task = f"""
+            Follow these steps precisely:
+            {login_steps}
             5. Click the "Repositories" button in top left
             6. Select repository "your_repository_name"
             7. Click "Add file" button
             8. Click "Upload files" option
-            9. Use the 'Upload pdf to element' action to upload the file. Try indices 0, 1, and 2.
+            9. Use the 'Upload pdf to element' action once to upload the file
             10. Add commit message: "Upload PDF file"
             11. Click "Commit changes" button
             """
@@ -117,7 +111,9 @@ class BrowserAutomation:
             )
 
             logger.info("Starting PDF upload to GitHub")
-            await agent.run()
+            history = await agent.run()
+            if history.is_done():
+                await sessions.save(GITHUB_SESSION, self.context, sites=["github.com"])
             logger.info("PDF upload completed successfully")
 
         except Exception as e:
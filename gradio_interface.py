@@ -1,72 +1,266 @@
 import os
+import time
+import shutil
 import asyncio
+import logging
 import gradio as gr
 from dotenv import load_dotenv, set_key, find_dotenv
 import tempfile
 from pathlib import Path
+from typing import Dict, Optional
+import recording
+from task_budget import USAGE_PREFIX
+from task_scheduler import QueueFullError
+
+# Gradio events waiting beyond this are rejected with "queue is full"
+GRADIO_QUEUE_SIZE = int(os.getenv("GRADIO_QUEUE_SIZE", "32"))
+# Concurrent "Run Task" events; tasks beyond the scheduler's running slots wait in its queue
+GRADIO_TASK_CONCURRENCY = int(os.getenv("GRADIO_TASK_CONCURRENCY", "16"))
+# GIF rendering is CPU-bound, so only a few at a time
+GRADIO_RENDER_CONCURRENCY = int(os.getenv("GRADIO_RENDER_CONCURRENCY", "2"))
+# A session's browser context goes back to the pool after this long without a task
+# (or as soon as another task needs it)
+GRADIO_SESSION_IDLE_MINUTES = float(os.getenv("GRADIO_SESSION_IDLE_MINUTES", "15"))
+# Sessions unused for this long are closed along with their files
+GRADIO_SESSION_EXPIRE_HOURS = float(os.getenv("GRADIO_SESSION_EXPIRE_HOURS", "12"))
+SESSION_REAP_INTERVAL = 10
+
+logger = logging.getLogger(__name__)
+
+
+class UISession:
+    """One visitor's state, kept in gr.State: a browser context leased for the session and a temp dir"""
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.context = None
+        self.temp_dir = Path(tempfile.mkdtemp(prefix="gradio-session-"))
+        self.busy = False
+        self.closed = False
+        # The browser tab went away; closed by the reaper once no task is running
+        self.unloaded = False
+        self.last_active = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return 0.0 if self.busy else time.monotonic() - self.last_active
+
 
 class GradioInterface:
-    def __init__(self, llm_manager, browser_automation):
+    def __init__(self, llm_manager, browser_automation, scheduler):
         self.llm_manager = llm_manager
         self.automation = browser_automation
+        self.scheduler = scheduler
         self.dotenv_path = find_dotenv()
-        self.temp_dir = Path(tempfile.mkdtemp())
+        # Open sessions by Gradio session hash, for idle reclamation and tab-close cleanup
+        self._sessions: Dict[str, UISession] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _get_session(self, session: Optional[UISession], request: Optional[gr.Request]) -> UISession:
+        """The caller's session, created on first use (or after it was closed)"""
+        if session is None or session.closed:
+            session = UISession(request.session_hash if request else "local")
+            self._sessions[session.id] = session
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_idle_sessions())
+        return session
+
+    async def _session_context(self, session: UISession):
+        """Lease a context for the session if a scheduler slot is free, taking one back from idle
+        sessions if needed; otherwise None and the task queues for a context like any other"""
+        if session.context is None:
+            if not self.scheduler.try_hold(session.id):
+                await self._release_idle_contexts()
+                if not self.scheduler.try_hold(session.id):
+                    return None
+            try:
+                session.context = await self.automation.acquire_context()
+            except Exception:
+                self.scheduler.unhold(session.id)
+                raise
+            logger.info(f"Leased a browser context for session {session.id}")
+        return session.context
+
+    async def _release_context(self, session: UISession):
+        context, session.context = session.context, None
+        if context is not None:
+            try:
+                await self.automation.release_context(context)
+            finally:
+                self.scheduler.unhold(session.id)
+            logger.info(f"Released the browser context of session {session.id}")
+
+    async def _release_idle_contexts(self):
+        """Give back the contexts of sessions that are not running a task"""
+        for session in list(self._sessions.values()):
+            if session.context is not None and not session.busy:
+                await self._release_context(session)
+
+    async def _close_session(self, session: UISession):
+        session.closed = True
+        self._sessions.pop(session.id, None)
+        await self._release_context(session)
+        shutil.rmtree(session.temp_dir, ignore_errors=True)
+
+    async def _reap_idle_sessions(self):
+        """Close unloaded and expired sessions, and give back idle or needed contexts; a session
+        whose context was taken back leases again on its next task"""
+        while self._sessions:
+            await asyncio.sleep(SESSION_REAP_INTERVAL)
+            needed = self.scheduler.waiting_for_slot() > 0
+            for session in list(self._sessions.values()):
+                if session.busy:
+                    continue
+                idle = session.idle_seconds()
+                try:
+                    if session.unloaded or idle > GRADIO_SESSION_EXPIRE_HOURS * 3600:
+                        await self._close_session(session)
+                    elif session.context is not None and (needed or idle > GRADIO_SESSION_IDLE_MINUTES * 60):
+                        await self._release_context(session)
+                except Exception as e:
+                    logger.error(f"Error reclaiming session {session.id}: {str(e)}")
 
     def get_model_choices(self):
         return [f"{id}. {model['name']} ({model['provider']})"
                 for id, model in self.llm_manager.MODELS.items()]
 
-    async def run_task(self, model_choice, task, continue_task=False):
+    async def run_task(self, model_choice, task, fallback_choices=None, hedge=False, session="", session_sites="",
+                       max_steps=None, max_tokens=None, max_cost=None, max_minutes=None, ui_session=None,
+                       request: gr.Request = None):
+        """Run a task on the session's browser context and yield status, progress and the latest step frame"""
+        hidden = gr.update(visible=False)
+        ui_session = self._get_session(ui_session, request)
+        if ui_session.busy:
+            yield "A task is already running in this session", gr.update(), gr.update(), hidden, hidden, gr.update(), ui_session
+            return
+        # Set before the first yield, so a second submit from this session sees it
+        ui_session.busy = True
         try:
             model_id = model_choice.split('.')[0]
             if not model_id in self.llm_manager.MODELS:
-                return "Invalid model selection", "", None, gr.update(visible=False), gr.update(visible=False)
+                yield "Invalid model selection", "", None, hidden, hidden, None, ui_session
+                return
 
             if not self.llm_manager.check_api_key(model_id):
-                return f"No API key set for {self.llm_manager.MODELS[model_id]['name']}", "", None, gr.update(visible=False), gr.update(visible=False)
+                yield f"No API key set for {self.llm_manager.MODELS[model_id]['name']}", "", None, hidden, hidden, None, ui_session
+                return
+
+            route = {}
+            fallback_models = [choice.split('.')[0] for choice in fallback_choices or []]
+            fallback_models = [id for id in fallback_models if id != model_id]
+            for id in fallback_models:
+                if not self.llm_manager.check_api_key(id):
+                    yield f"No API key set for {self.llm_manager.MODELS[id]['name']}", "", None, hidden, hidden, None, ui_session
+                    return
+            if fallback_models:
+                route = {"fallback_models": fallback_models, "route_mode": "hedge" if hedge else "fallback"}
+            if session and session.strip():
+                route["session"] = session.strip()
+                route["session_sites"] = [site.strip() for site in (session_sites or "").split(",") if site.strip()] or None
+
+            route["budget"] = {
+                "max_steps": max_steps or None,
+                "max_tokens": max_tokens or None,
+                "max_cost": max_cost or None,
+                "max_seconds": max_minutes * 60 if max_minutes else None,
+            }
 
             if not task.strip():
-                return "Task cannot be empty", "", None, gr.update(visible=False), gr.update(visible=False)
-
-            # Create message and screenshot queues
-            message_queue = asyncio.Queue()
-            screenshot_queue = asyncio.Queue()
-
-            # Run task with queues
-            await self.automation.run_task(
-                task,
-                model_id,
-                message_queue=message_queue,
-                screenshot_queue=screenshot_queue
-            )
+                yield "Task cannot be empty", "", None, hidden, hidden, None, ui_session
+                return
 
-            # Get messages and screenshots
             messages = []
-            while not message_queue.empty():
-                messages.append(await message_queue.get())
+            latest_screenshot = None
+            task_id = None
+            usage = ""
+            final_status = "Task completed successfully."
+            yield "Task running...", "", None, hidden, hidden, None, ui_session
+
+            submitter = f"gradio:{request.session_hash}" if request else "gradio"
+            context = await self._session_context(ui_session)
+            if context is not None:
+                route.update(context=context, holder=ui_session.id)
+            async for kind, item in self.scheduler.stream_task(task, model_id, submitter=submitter, **route):
+                if kind == "queued":
+                    queued = self.scheduler.describe_position(item)
+                    if queued:
+                        yield f"{queued}...", "", None, hidden, hidden, None, ui_session
+                    continue
+                if kind == "message":
+                    if item.startswith(USAGE_PREFIX):
+                        # Running token/cost totals go to the status box instead of the progress log
+                        usage = item[len(USAGE_PREFIX):]
+                    else:
+                        messages.append(item)
+                elif kind == "screenshot":
+                    latest_screenshot = item
+                elif kind == "artifacts":
+                    task_id = item.task_id
+                    if item.metadata.get("status") == "stopped":
+                        final_status = f"Task stopped: {item.metadata.get('stop_reason')}."
+                status = f"Task running... {usage}" if usage else "Task running..."
+                yield status, "\n".join(messages), latest_screenshot, hidden, hidden, task_id, ui_session
 
-            # Check for agent_history.gif in the project directory
-            gif_path = os.path.join(os.getcwd(), "agent_history.gif")
-            
             # Show continue buttons after task completion
-            return ("Task completed successfully. Would you like to perform another task?", 
-                    "\n".join(messages), 
-                    gif_path if os.path.exists(gif_path) else None,
-                    gr.update(visible=True),  # Yes button
-                    gr.update(visible=True))  # No button
+            if usage:
+                final_status += f"\n{usage}"
+            yield (f"{final_status} Would you like to perform another task?",
+                   "\n".join(messages),
+                   latest_screenshot,
+                   gr.update(visible=True),  # Yes button
+                   gr.update(visible=True),  # No button
+                   task_id,
+                   ui_session)
+
+        except QueueFullError as e:
+            yield f"Server busy: {str(e)}", "", None, hidden, hidden, None, ui_session
+        except Exception as e:
+            yield f"Error executing task: {str(e)}", "", None, hidden, hidden, None, ui_session
+        finally:
+            ui_session.busy = False
+            ui_session.last_active = time.monotonic()
+            if ui_session.context is not None and self.scheduler.waiting_for_slot():
+                # Other tasks are queued for a context; this session leases again next time
+                await self._release_context(ui_session)
+
+    def show_frame(self, task_id, index, delta=0):
+        """Load a single recorded frame of a task; frames are read from disk only when paged to"""
+        artifacts = self.automation.artifacts.get(task_id) if task_id else None
+        frame = recording.frame_at(artifacts, index + delta) if artifacts else None
+        if frame is None:
+            return None, 0, "No frames recorded"
+        label = f"Step {frame['step']} ({frame['index'] + 1}/{frame['total']}) {frame['url']}"
+        return frame["path"], frame["index"], label
 
+    async def render_gif(self, task_id):
+        """Render the task's GIF on the worker pool without blocking the event loop"""
+        artifacts = self.automation.artifacts.get(task_id) if task_id else None
+        if artifacts is None:
+            return None, "No task recording available"
+        try:
+            gif_path = await asyncio.wrap_future(recording.render_gif(artifacts))
+            return gif_path, "GIF rendered"
         except Exception as e:
-            return f"Error executing task: {str(e)}", "", None, gr.update(visible=False), gr.update(visible=False)
-
-    async def cleanup_and_exit(self):
-        await self.automation.cleanup()
-        # Exit the entire process
-        os._exit(0)
-        return ("Browser closed. Exiting...", 
-                "", 
+            return None, f"Error rendering GIF: {str(e)}"
+
+    async def close_session(self, ui_session):
+        """Free this visitor's browser context and files; other sessions and the server keep running"""
+        if ui_session is not None and not ui_session.closed:
+            await self._close_session(ui_session)
+        return ("Session closed. Run a new task to start another one.",
+                "",
                 None,
                 gr.update(visible=False),
-                gr.update(visible=False))
+                gr.update(visible=False),
+                None)
+
+    async def on_unload(self, request: gr.Request):
+        """Close the session when its browser tab goes away (after its running task, if any)"""
+        session = self._sessions.get(request.session_hash)
+        if session is None:
+            return
+        session.unloaded = True
+        if not session.busy:
+            await self._close_session(session)
 
     def create_interface(self):
         with gr.Blocks() as interface:
@@ -78,6 +272,32 @@ class GradioInterface:
                         label="Select AI Model",
                         interactive=True
                     )
+                    fallback_dropdown = gr.Dropdown(
+                        model_choices,
+                        label="Fallback Models (in order)",
+                        multiselect=True,
+                        interactive=True
+                    )
+                    hedge_checkbox = gr.Checkbox(
+                        label="Hedge: send each step to the first two models and use the first answer"
+                    )
+                    with gr.Row():
+                        session_input = gr.Textbox(
+                            label="Session Profile",
+                            placeholder="e.g. github (optional)",
+                            interactive=True
+                        )
+                        session_sites_input = gr.Textbox(
+                            label="Session Sites",
+                            placeholder="e.g. github.com (empty for all)",
+                            interactive=True
+                        )
+                    with gr.Accordion("Budget Caps (empty = defaults)", open=False):
+                        with gr.Row():
+                            max_steps_input = gr.Number(label="Max Steps", precision=0)
+                            max_tokens_input = gr.Number(label="Max Tokens", precision=0)
+                            max_cost_input = gr.Number(label="Max Cost (USD)")
+                            max_minutes_input = gr.Number(label="Max Minutes")
                     task_input = gr.Textbox(
                         label="Task Description",
                         lines=3,
@@ -88,7 +308,7 @@ class GradioInterface:
                         run_button = gr.Button("Run Task")
                     with gr.Row():
                         yes_button = gr.Button("Yes, New Task", visible=False)
-                        no_button = gr.Button("No, Close Browser", visible=False)
+                        no_button = gr.Button("No, Close My Session", visible=False)
 
                 with gr.Column():
                     output = gr.Textbox(label="Status", lines=2)
@@ -102,11 +322,44 @@ class GradioInterface:
                         type="filepath",
                         format="gif"
                     )
+                    frame_label = gr.Markdown()
+                    with gr.Row():
+                        prev_button = gr.Button("◀ Previous Step")
+                        next_button = gr.Button("Next Step ▶")
+                        gif_button = gr.Button("Render GIF")
+
+            session_state = gr.State(None)
+            task_id_state = gr.State(None)
+            frame_index = gr.State(0)
 
             run_button.click(
                 fn=self.run_task,
-                inputs=[model_dropdown, task_input],
-                outputs=[output, message_output, screenshot_output, yes_button, no_button]
+                inputs=[model_dropdown, task_input, fallback_dropdown, hedge_checkbox, session_input, session_sites_input,
+                        max_steps_input, max_tokens_input, max_cost_input, max_minutes_input, session_state],
+                outputs=[output, message_output, screenshot_output, yes_button, no_button, task_id_state, session_state],
+                concurrency_limit=GRADIO_TASK_CONCURRENCY,
+                concurrency_id="tasks"
+            )
+
+            prev_button.click(
+                fn=lambda task_id, index: self.show_frame(task_id, index, -1),
+                inputs=[task_id_state, frame_index],
+                outputs=[screenshot_output, frame_index, frame_label],
+                concurrency_limit=None
+            )
+
+            next_button.click(
+                fn=lambda task_id, index: self.show_frame(task_id, index, 1),
+                inputs=[task_id_state, frame_index],
+                outputs=[screenshot_output, frame_index, frame_label],
+                concurrency_limit=None
+            )
+
+            gif_button.click(
+                fn=self.render_gif,
+                inputs=[task_id_state],
+                outputs=[screenshot_output, frame_label],
+                concurrency_limit=GRADIO_RENDER_CONCURRENCY
             )
 
             yes_button.click(
@@ -115,12 +368,16 @@ class GradioInterface:
             )
 
             no_button.click(
-                fn=self.cleanup_and_exit,
-                outputs=[output, message_output, screenshot_output, yes_button, no_button]
+                fn=self.close_session,
+                inputs=[session_state],
+                outputs=[output, message_output, screenshot_output, yes_button, no_button, session_state]
             )
 
+            interface.unload(self.on_unload)
+
         return interface
 
-def create_gradio_interface(llm_manager, browser_automation):
-    interface = GradioInterface(llm_manager, browser_automation)
-    return interface.create_interface()
\ No newline at end of file
+def create_gradio_interface(llm_manager, browser_automation, scheduler):
+    interface = GradioInterface(llm_manager, browser_automation, scheduler)
+    # A bounded queue: users see their position and ETA, and events beyond max_size are rejected
+    return interface.create_interface().queue(max_size=GRADIO_QUEUE_SIZE, default_concurrency_limit=1)
\ No newline at end of file
@@ -1,9 +1,7 @@
 #!/bin/bash
 
-# Update package list and install xvfb
-# sudo apt-get update
-# sudo apt-get install -y xvfb
-
+# Chromium runs headless by default (BROWSER_HEADLESS=true), so no X server or
+# xvfb-run is needed. Tune BROWSER_* in .env (see .env.example).
 
 # Kill any process using port 7860
 kill -9 $(lsof -t -i :7860) 2>/dev/null
@@ -12,4 +10,4 @@ kill -9 $(lsof -t -i :7860) 2>/dev/null
 source venv/bin/activate
 
 # Run the main Python script
-xvfb-run -a python3 main.py
+BROWSER_HEADLESS=true python3 main.py
@@ -0,0 +1,142 @@
+import os
+import csv
+import sqlite3
+import logging
+import threading
+import atexit
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = ("title", "company", "link", "fit_score", "location", "salary")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    company TEXT NOT NULL COLLATE NOCASE,
+    link TEXT NOT NULL,
+    fit_score REAL NOT NULL,
+    location TEXT COLLATE NOCASE,
+    salary TEXT,
+    saved_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_link ON jobs(link);
+CREATE INDEX IF NOT EXISTS jobs_company_score ON jobs(company, fit_score DESC);
+CREATE INDEX IF NOT EXISTS jobs_score ON jobs(fit_score DESC);
+CREATE INDEX IF NOT EXISTS jobs_location ON jobs(location);
+"""
+
+# Re-saving a link keeps one row with the latest details and the best score seen
+_UPSERT = """
+INSERT INTO jobs (title, company, link, fit_score, location, salary)
+VALUES (:title, :company, :link, :fit_score, :location, :salary)
+ON CONFLICT(link) DO UPDATE SET
+    title = excluded.title,
+    company = excluded.company,
+    fit_score = MAX(jobs.fit_score, excluded.fit_score),
+    location = COALESCE(excluded.location, jobs.location),
+    salary = COALESCE(excluded.salary, jobs.salary)
+"""
+
+
+class JobStore:
+    """SQLite job store with one row per link, buffered writes and bounded queries"""
+
+    def __init__(self, path: str = "jobs.db", batch_size: int = 20):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        atexit.register(self.close)
+
+    def add(self, job: Dict[str, Any]) -> None:
+        """Queue a job for writing; the batch is written once batch_size jobs are pending"""
+        row = {field: job.get(field) for field in JOB_FIELDS}
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._pending:
+            return
+        # Take the batch first, so a failing row is not replayed by every later flush
+        batch, self._pending = self._pending, []
+        try:
+            with self._conn:
+                self._conn.executemany(_UPSERT, batch)
+            logger.info(f"Saved {len(batch)} job(s) to {self.path}")
+        except sqlite3.Error as e:
+            logger.warning(f"Batch write failed ({str(e)}), saving {len(batch)} job(s) one at a time")
+            for row in batch:
+                try:
+                    with self._conn:
+                        self._conn.execute(_UPSERT, row)
+                except sqlite3.Error as e:
+                    logger.error(f"Dropped job {row.get('link')}: {str(e)}")
+
+    def query(self, company: Optional[str] = None, min_fit_score: Optional[float] = None,
+              location: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top jobs by fit_score matching the filters (company/location match as substrings)"""
+        clauses, params = [], []
+        if company:
+            clauses.append("company LIKE ?")
+            params.append(f"%{company}%")
+        if min_fit_score is not None:
+            clauses.append("fit_score >= ?")
+            params.append(min_fit_score)
+        if location:
+            clauses.append("location LIKE ?")
+            params.append(f"%{location}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._lock:
+            self._flush_locked()
+            rows = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs {where} ORDER BY fit_score DESC, id LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            self._flush_locked()
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def import_csv(self, csv_path: str) -> int:
+        """Import rows from the legacy jobs.csv (title, company, link, link, location)"""
+        if not os.path.exists(csv_path):
+            return 0
+        imported = 0
+        with open(csv_path, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                self.add({
+                    "title": row[0],
+                    "company": row[1],
+                    "link": row[2],
+                    "fit_score": 0.0,
+                    "location": row[4] if len(row) > 4 and row[4] else None,
+                })
+                imported += 1
+        self.flush()
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._flush_locked()
+                self._conn.close()
+            except sqlite3.ProgrammingError:
+                # Already closed
+                pass
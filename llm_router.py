@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How a routed call uses the preference list
+ROUTE_FALLBACK = "fallback"  # one model at a time; the next one joins after an error or a slow answer
+ROUTE_HEDGE = "hedge"        # the first two models from the start; the first good answer wins
+ROUTE_MODES = (ROUTE_FALLBACK, ROUTE_HEDGE)
+
+ROUTE_MODE = os.getenv("LLM_ROUTE_MODE", ROUTE_FALLBACK)
+# Seconds without an answer before the next model is tried alongside the slow one
+ROUTE_LATENCY_THRESHOLD = float(os.getenv("LLM_ROUTE_LATENCY_THRESHOLD", "20"))
+
+
+class ProviderHealth:
+    """Recent latency and error rate of one model, as exponentially weighted moving averages"""
+
+    # Consecutive errors before the model is skipped for a while
+    COOLDOWN_AFTER = 3
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+                self.consecutive_errors = 0
+                self.cooldown_until = 0.0
+            else:
+                self.consecutive_errors += 1
+                if self.consecutive_errors >= self.COOLDOWN_AFTER:
+                    backoff = min(300.0, 15.0 * 2 ** (self.consecutive_errors - self.COOLDOWN_AFTER))
+                    self.cooldown_until = time.monotonic() + backoff
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until and self.error_rate < 0.5
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "latency": None if self.latency is None else round(self.latency, 3),
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+        }
+
+
+_health: Dict[str, ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_health(model_id: str) -> ProviderHealth:
+    """Health tracker shared by every routed call to model_id"""
+    with _health_lock:
+        if model_id not in _health:
+            _health[model_id] = ProviderHealth()
+        return _health[model_id]
+
+
+def health_report() -> Dict[str, Dict[str, Any]]:
+    with _health_lock:
+        return {model_id: health.to_dict() for model_id, health in _health.items()}
+
+
+class RoutedChatModel:
+    """Chat model facade that sends each call along a preference list of models.
+
+    Supports the parts of the LangChain chat model interface the agent uses
+    (ainvoke/invoke and with_structured_output). Unhealthy models move to the
+    back of the list. In fallback mode an error or an answer slower than
+    latency_threshold brings in the next model, and the first good answer wins;
+    hedge mode starts with the first two models in parallel.
+    """
+
+    def __init__(self, clients: List[Tuple[str, str, Any]], mode: str = ROUTE_MODE,
+                 latency_threshold: float = ROUTE_LATENCY_THRESHOLD):
+        if not clients:
+            raise ValueError("RoutedChatModel needs at least one model")
+        if mode not in ROUTE_MODES:
+            raise ValueError(f"Invalid route mode: {mode}")
+        # (model_id, display name, chat model) in preference order
+        self.clients = clients
+        self.mode = mode
+        self.latency_threshold = latency_threshold
+        self.answered_by: Counter = Counter()
+
+    @property
+    def model_name(self) -> str:
+        client = self.clients[0][2]
+        return getattr(client, "model_name", None) or getattr(client, "model", "unknown")
+
+    def _ordered(self, calls: List[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        # Stable sort keeps the preference order within healthy and unhealthy models
+        return sorted(calls, key=lambda call: not get_health(call[0]).healthy)
+
+    async def _route(self, calls: List[Tuple[str, Callable[[], Awaitable[Any]]]]) -> Any:
+        remaining = self._ordered(calls)
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+        last_error: Optional[BaseException] = None
+        last_result: Any = None
+
+        def launch():
+            model_id, call = remaining.pop(0)
+            pending[asyncio.ensure_future(call())] = (model_id, time.monotonic())
+
+        launch()
+        if self.mode == ROUTE_HEDGE and remaining:
+            launch()
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=self.latency_threshold if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    slow = ", ".join(self._name(model_id) for model_id, _ in pending.values())
+                    logger.info(f"No answer from {slow} after {self.latency_threshold:.0f}s; "
+                                f"also trying {self._name(remaining[0][0])}")
+                    launch()
+                    continue
+
+                for future in done:
+                    model_id, started = pending.pop(future)
+                    latency = time.monotonic() - started
+                    error = future.exception()
+                    # Structured output with include_raw reports unparseable answers instead of raising
+                    if error is None and isinstance(future.result(), dict) and future.result().get("parsing_error"):
+                        error = future.result()["parsing_error"]
+                        last_result = future.result()
+                    get_health(model_id).record(latency, ok=error is None)
+                    if error is None:
+                        self.answered_by[model_id] += 1
+                        if model_id != self.clients[0][0]:
+                            logger.info(f"Answer from fallback model {self._name(model_id)} in {latency:.1f}s")
+                        return future.result()
+                    logger.warning(f"{self._name(model_id)} failed after {latency:.1f}s: {error}")
+                    last_error = error
+                    if remaining:
+                        launch()
+        finally:
+            for future in pending:
+                future.cancel()
+
+        if last_result is not None:
+            return last_result
+        raise last_error
+
+    def _name(self, model_id: str) -> str:
+        for client_id, name, _ in self.clients:
+            if client_id == model_id:
+                return name
+        return model_id
+
+    def _sync_route(self, calls: List[Tuple[str, Callable[[], Any]]]) -> Any:
+        """Blocking calls can't be raced, so fall back on errors only"""
+        last_error: Optional[BaseException] = None
+        for model_id, call in self._ordered(calls):
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                get_health(model_id).record(time.monotonic() - started, ok=False)
+                last_error = e
+                continue
+            get_health(model_id).record(time.monotonic() - started, ok=True)
+            self.answered_by[model_id] += 1
+            return result
+        raise last_error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self._route([
+            (model_id, lambda client=client: client.ainvoke(input, config, **kwargs))
+            for model_id, _, client in self.clients
+        ])
+
+    def invoke(self, input, config=None, **kwargs):
+        return self._sync_route([
+            (model_id, lambda client=client: client.invoke(input, config, **kwargs))
+            for model_id, _, client in self.clients
+        ])
+
+    def with_structured_output(self, schema, **kwargs) -> "_RoutedRunnable":
+        runnables = []
+        for model_id, _, client in self.clients:
+            client_kwargs = dict(kwargs)
+            if "method" not in client_kwargs and type(client).__name__ == "ChatOpenAI":
+                # What the agent would have asked an OpenAI model for directly
+                client_kwargs["method"] = "function_calling"
+            runnables.append((model_id, client.with_structured_output(schema, **client_kwargs)))
+        return _RoutedRunnable(self, runnables)
+
+
+class _RoutedRunnable:
+    """Per-model runnables (e.g. structured output) called through the router"""
+
+    def __init__(self, router: RoutedChatModel, runnables: List[Tuple[str, Any]]):
+        self.router = router
+        self.runnables = runnables
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.router._route([
+            (model_id, lambda runnable=runnable: runnable.ainvoke(input, config, **kwargs))
+            for model_id, runnable in self.runnables
+        ])
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.router._sync_route([
+            (model_id, lambda runnable=runnable: runnable.invoke(input, config, **kwargs))
+            for model_id, runnable in self.runnables
+        ])
@@ -0,0 +1,159 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Correlation ids for the current task and agent step; asyncio tasks inherit them
+task_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_id", default=None)
+step_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("step", default=None)
+
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(float(os.getenv("LOG_MAX_MB", "10")) * 1024 * 1024)
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(task_id)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the task/step ids of the code that logged them.
+
+    Attached to the queue handler, so it runs in the caller before the record
+    is queued, while the context variables still hold the caller's values.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.task_id = task_id_var.get() or "-"
+        record.step = step_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "task_id": None if getattr(record, "task_id", "-") == "-" else record.task_id,
+            "step": getattr(record, "step", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TaskLogRouter(logging.Handler):
+    """Copies the records of registered tasks into each task's own JSON-lines file"""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(JsonFormatter())
+        self._files: Dict[str, logging.FileHandler] = {}
+        self._files_lock = threading.Lock()
+
+    def open(self, task_id: str, path: Path):
+        handler = logging.FileHandler(path, encoding="utf-8", delay=True)
+        handler.setFormatter(self.formatter)
+        with self._files_lock:
+            self._files[task_id] = handler
+
+    def close_task(self, task_id: str):
+        """Close the task's file once the records already queued for it are written"""
+        if _queue_handler is None:
+            with self._files_lock:
+                handler = self._files.pop(task_id, None)
+            if handler:
+                handler.close()
+            return
+        # Goes through the queue behind the task's last records, bypassing logger levels
+        _queue_handler.handle(logging.makeLogRecord({
+            "name": __name__, "levelno": logging.DEBUG, "levelname": "DEBUG",
+            "msg": f"Closing log of task {task_id}", "close_task_log": task_id,
+        }))
+
+    def emit(self, record: logging.LogRecord):
+        with self._files_lock:
+            handler = self._files.get(getattr(record, "task_id", "-"))
+            closing = self._files.pop(getattr(record, "close_task_log", None), None)
+        if handler:
+            handler.emit(record)
+        if closing:
+            closing.close()
+
+
+task_logs = TaskLogRouter()
+
+
+def setup_logging(log_file: Optional[str] = LOG_FILE, level: str = LOG_LEVEL, console: bool = True):
+    """Route all logging through a queue to a background thread.
+
+    Callers only enqueue records; the listener thread writes JSON lines to a
+    size-rotated log_file, human-readable lines to the console and per-task
+    files registered with task_logs. Safe to call more than once.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        handlers = [task_logs]
+        if log_file:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter())
+            file_handler.setLevel(level)
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            console_handler.setLevel(level)
+            handlers.append(console_handler)
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+        _queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def adopt_logger(name: str):
+    """Send a library logger that installs its own handlers (browser_use does) through the queue"""
+    library_logger = logging.getLogger(name)
+    if library_logger.propagate and not library_logger.handlers:
+        return
+    for handler in library_logger.handlers[:]:
+        library_logger.removeHandler(handler)
+    library_logger.propagate = True
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            _queue_handler = None
@@ -1,30 +1,28 @@
 import os
 import asyncio
-from typing import Dict, Any, Optional
+import concurrent.futures
+import hashlib
+import importlib
+import time
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional, Tuple, Union
 from dotenv import load_dotenv, set_key, find_dotenv
-from browser_use import Agent, Controller
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_anthropic import ChatAnthropic
-from langchain_openai import ChatOpenAI
 import logging
 import threading
 from filelock import FileLock
-from browser_use.browser import browser
-import pyperclip
-
-# Conditional import for Gradio
-if os.getenv("ENABLE_GRADIO") == "true":
-    from gradio_interface import create_gradio_interface
-
-# Enhanced logging configuration
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+from async_console import ainput
+from browser_pool import BrowserContextPool, RESET_RECREATE
+from task_scheduler import TaskScheduler
+from task_artifacts import ArtifactStore, TaskArtifacts
+from session_store import SessionStore
+import recording
+import llm_router
+import metrics
+from task_budget import TaskBudget, format_usage, stop_between_steps
+from log_setup import setup_logging, adopt_logger, task_logs, task_id_var, step_var
+
+# JSON lines to a rotating app.log and per-task logs, written off the event loops
+setup_logging()
 logger = logging.getLogger(__name__)
 
 def initialize_environment() -> str:
@@ -40,35 +38,62 @@ def initialize_environment() -> str:
 dotenv_path = initialize_environment()
 load_dotenv(dotenv_path)
 
-Browser = browser.Browser
-BrowserContext = browser.BrowserContext
+# Consecutive failed steps (including rate-limited LLM calls) before the agent gives up
+AGENT_MAX_FAILURES = int(os.getenv("AGENT_MAX_FAILURES", "5"))
+AGENT_RETRY_DELAY = int(os.getenv("AGENT_RETRY_DELAY", "2"))
+# Step cap of Agent.run() when the task's budget sets none
+DEFAULT_MAX_STEPS = 100
 
 class LLMManager:
     """Manages multiple LLM providers with API key verification and management"""
 
     _env_lock = FileLock(".env.lock")
 
+    # Provider SDKs are heavy to import, so "class" is a "module:Class" path resolved on first use.
+    # "rate_limits" (rpm, tpm, base_backoff, max_backoff) are shared by every client using the same key.
+    # "cost_per_1k" is the estimated USD per 1K input/output tokens used for cost accounting and budgets.
+    _loaded_classes: Dict[str, Any] = {}
+
+    # Verification results keyed by (provider, key fingerprint) -> (verified_at, is_valid, message)
+    VERIFY_TTL = int(os.getenv("API_KEY_VERIFY_TTL", "3600"))
+    VERIFY_FAILURE_TTL = int(os.getenv("API_KEY_VERIFY_FAILURE_TTL", "60"))
+    _verification_cache: Dict[Tuple[str, str], Tuple[float, bool, str]] = {}
+    _refresh_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    # Chat clients (and their HTTP connection pools) shared across tasks
+    _client_cache: Dict[Tuple, Tuple[Optional[asyncio.AbstractEventLoop], Any]] = {}
+    _client_lock = threading.Lock()
+
     MODELS = {
         "1": {
             "name": "Gemini",
             "provider": "Google",
             "model": "gemini-2.0-flash-exp",
             "key_env": "GOOGLE_API_KEY",
-            "class": ChatGoogleGenerativeAI
+            "max_concurrency": 4,
+            "rate_limits": {"rpm": 10, "tpm": 1_000_000},
+            "cost_per_1k": {"input": 0.0001, "output": 0.0004},
+            "class": "langchain_google_genai:ChatGoogleGenerativeAI"
         },
         "2": {
             "name": "Claude",
             "provider": "Anthropic",
             "model": "claude-3-opus-20240229",
             "key_env": "ANTHROPIC_API_KEY",
-            "class": ChatAnthropic
+            "max_concurrency": 2,
+            "rate_limits": {"rpm": 50, "tpm": 20_000},
+            "cost_per_1k": {"input": 0.015, "output": 0.075},
+            "class": "langchain_anthropic:ChatAnthropic"
         },
         "3": {
             "name": "GPT-4",
             "provider": "OpenAI",
             "model": "gpt-4",
             "key_env": "OPENAI_API_KEY",
-            "class": ChatOpenAI
+            "max_concurrency": 2,
+            "rate_limits": {"rpm": 500, "tpm": 10_000},
+            "cost_per_1k": {"input": 0.03, "output": 0.06},
+            "class": "langchain_openai:ChatOpenAI"
         }
     }
 
@@ -92,6 +117,36 @@ class LLMManager:
             return "Not set"
         return f"{key[:4]}...{key[-4:]}"
 
+    @classmethod
+    def _key_fingerprint(cls, key: str) -> str:
+        """Stable, non-reversible fingerprint of an API key for cache keys"""
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def _verification_key(cls, model_id: str, api_key: str) -> Tuple[str, str]:
+        return cls.MODELS[model_id]["provider"], cls._key_fingerprint(api_key)
+
+    @classmethod
+    def _get_cached_verification(cls, model_id: str, api_key: str) -> Optional[Tuple[bool, str, bool]]:
+        """Return (is_valid, message, is_fresh) for a cached verification, or None on a miss"""
+        entry = cls._verification_cache.get(cls._verification_key(model_id, api_key))
+        if entry is None:
+            return None
+        verified_at, is_valid, message = entry
+        ttl = cls.VERIFY_TTL if is_valid else cls.VERIFY_FAILURE_TTL
+        return is_valid, message, (time.monotonic() - verified_at) < ttl
+
+    @classmethod
+    def _store_verification(cls, model_id: str, api_key: str, is_valid: bool, message: str) -> None:
+        cls._verification_cache[cls._verification_key(model_id, api_key)] = (time.monotonic(), is_valid, message)
+
+    @classmethod
+    def _invalidate_verification(cls, key_env: str) -> None:
+        """Drop cached verification results for the provider that owns key_env"""
+        provider = cls._get_provider(key_env)
+        for cache_key in [k for k in cls._verification_cache if k[0] == provider]:
+            del cls._verification_cache[cache_key]
+
     @classmethod
     async def _update_env_safely(cls, key_env: str, new_key: str) -> bool:
         """Atomic environment updates with file locking"""
@@ -99,6 +154,9 @@ class LLMManager:
             try:
                 set_key(dotenv_path, key_env, new_key.strip())
                 load_dotenv(dotenv_path, override=True)
+                # Covers add_update_api_key, remove_api_key and reverts
+                cls._invalidate_verification(key_env)
+                cls._evict_clients(key_env)
                 return True
             except Exception as e:
                 logger.error(f"Error updating environment: {str(e)}")
@@ -133,27 +191,11 @@ class LLMManager:
             if not cls._validate_key_format(config["provider"], api_key):
                 return False, f"❌ Invalid {config['provider']} API key format"
 
-            # Initialize LLM
-            llm = None
+            from rate_limiter import call_with_backoff
+
+            # Reuse the pooled client for this key
             try:
-                if config["provider"] == "Google":
-                    llm = config["class"](
-                        google_api_key=api_key,
-                        model=config["model"],
-                        temperature=0
-                    )
-                elif config["provider"] == "Anthropic":
-                    llm = config["class"](
-                        anthropic_api_key=api_key,
-                        model=config["model"],
-                        temperature=0
-                    )
-                else:  # OpenAI
-                    llm = config["class"](
-                        api_key=api_key,
-                        model=config["model"],
-                        temperature=0
-                    )
+                llm = cls._get_client(model_id, api_key, temperature=0)
             except Exception as e:
                 logger.error(f"Error initializing LLM for verification: {e}")
                 return False, f"❌ Error initializing LLM: {str(e)}"
@@ -161,7 +203,8 @@ class LLMManager:
             # Test prompt
             try:
                 messages = [{"role": "user", "content": "Respond with exactly 'OK' and nothing else"}]
-                response = await llm.ainvoke(messages)
+                response = await call_with_backoff(lambda: llm.ainvoke(messages),
+                                                   cls._get_limiter(config, api_key))
 
                 if "OK" in str(response.content):
                     return True, "✅ API key verified successfully"
@@ -177,7 +220,7 @@ class LLMManager:
 
     @classmethod
     def get_llm(cls, model_id: str):
-        """Initialize and return LLM instance with error handling"""
+        """Return a shared LLM client for the model, reused across tasks until its key changes"""
         if model_id not in cls.MODELS:
             raise ValueError(f"Invalid model ID: {model_id}")
 
@@ -191,39 +234,168 @@ class LLMManager:
             raise ValueError(f"Invalid {config['provider']} API key format")
 
         try:
-            if config["provider"] == "Google":
-                return config["class"](
-                    google_api_key=api_key,
-                    model=config["model"]
-                )
-            elif config["provider"] == "Anthropic":
-                return config["class"](
-                    anthropic_api_key=api_key,
-                    model=config["model"]
-                )
-            else:  # OpenAI
-                return config["class"](
-                    api_key=api_key,
-                    model=config["model"]
-                )
+            return cls._get_client(model_id, api_key)
         except Exception as e:
             logger.error(f"Error initializing {config['name']}: {str(e)}")
             raise
 
+    @classmethod
+    def get_router(cls, model_ids: List[str], mode: Optional[str] = None):
+        """Return a chat model that routes each call along model_ids, skipping models without a usable key"""
+        clients = []
+        for model_id in dict.fromkeys(model_ids):
+            try:
+                clients.append((model_id, cls.MODELS[model_id]["name"], cls.get_llm(model_id)))
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Leaving model {model_id} out of the route: {e}")
+        if not clients:
+            raise ValueError("None of the preferred models has a usable API key")
+        return llm_router.RoutedChatModel(clients, mode=mode or llm_router.ROUTE_MODE)
+
+    @classmethod
+    def _load_class(cls, config: Dict[str, Any]):
+        """Import the provider's chat model class the first time it is needed"""
+        class_path = config["class"]
+        if not isinstance(class_path, str):
+            return class_path
+        if class_path not in cls._loaded_classes:
+            module_name, class_name = class_path.split(":")
+            cls._loaded_classes[class_path] = getattr(importlib.import_module(module_name), class_name)
+        return cls._loaded_classes[class_path]
+
+    @classmethod
+    def _build_llm(cls, config: Dict[str, Any], api_key: str, **options):
+        """Construct a chat model client for the provider, paced by the key's rate limiter"""
+        from rate_limiter import LLMMetricsCallbackHandler, RateLimitCallbackHandler
+
+        llm_class = cls._load_class(config)
+        options.setdefault("callbacks", [
+            RateLimitCallbackHandler(cls._get_limiter(config, api_key)),
+            LLMMetricsCallbackHandler(config["model"], config["provider"], config.get("cost_per_1k")),
+        ])
+        if config["provider"] == "Google":
+            return llm_class(google_api_key=api_key, model=config["model"], **options)
+        elif config["provider"] == "Anthropic":
+            return llm_class(anthropic_api_key=api_key, model=config["model"], **options)
+        else:  # OpenAI
+            return llm_class(api_key=api_key, model=config["model"], **options)
+
+    @classmethod
+    def _get_limiter(cls, config: Dict[str, Any], api_key: str):
+        """Rate limiter shared by all clients for this provider and key"""
+        from rate_limiter import get_limiter
+
+        return get_limiter(config["provider"], cls._key_fingerprint(api_key), config.get("rate_limits"))
+
+    @classmethod
+    def _get_client(cls, model_id: str, api_key: str, **options):
+        """Return a shared client for (provider, model, key, options), building it on first use.
+
+        Clients hold HTTP connection pools that are bound to the event loop they
+        are first used on, so each loop (terminal, browser, Gradio) gets its own.
+        """
+        config = cls.MODELS[model_id]
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        cache_key = (config["provider"], config["model"], cls._key_fingerprint(api_key),
+                     tuple(sorted(options.items())), id(loop))
+
+        with cls._client_lock:
+            entry = cls._client_cache.get(cache_key)
+            if entry and entry[0] is loop:
+                return entry[1]
+
+            # Drop clients whose event loop has gone away
+            for stale_key in [k for k, (l, _) in cls._client_cache.items() if l is not None and l.is_closed()]:
+                del cls._client_cache[stale_key]
+
+            llm = cls._build_llm(config, api_key, **options)
+            cls._client_cache[cache_key] = (loop, llm)
+            return llm
+
+    @classmethod
+    def _evict_clients(cls, key_env: str) -> None:
+        """Drop cached clients for the provider that owns key_env"""
+        provider = cls._get_provider(key_env)
+        with cls._client_lock:
+            for cache_key in [k for k in cls._client_cache if k[0] == provider]:
+                del cls._client_cache[cache_key]
+
+    @classmethod
+    async def verify_api_key_cached(cls, model_id: str, force: bool = False) -> tuple[bool, str]:
+        """Verify API key, reusing a fresh cached result unless force is set"""
+        api_key = os.getenv(cls.MODELS[model_id]["key_env"])
+        if not api_key:
+            return False, "No API key found"
+
+        if not force:
+            cached = cls._get_cached_verification(model_id, api_key)
+            if cached and cached[2]:
+                return cached[0], cached[1]
+
+        is_valid, message = await cls.verify_api_key(model_id)
+        cls._store_verification(model_id, api_key, is_valid, message)
+        return is_valid, message
+
+    @classmethod
+    def _schedule_refresh(cls, model_id: str) -> None:
+        """Re-verify a stale cache entry in the background, at most once per key"""
+        api_key = os.getenv(cls.MODELS[model_id]["key_env"])
+        if not api_key:
+            return
+        cache_key = cls._verification_key(model_id, api_key)
+        task = cls._refresh_tasks.get(cache_key)
+        if task and not task.done():
+            return
+
+        async def refresh():
+            try:
+                await cls.verify_api_key_cached(model_id, force=True)
+            except Exception as e:
+                logger.error(f"Background verification failed for {cls.MODELS[model_id]['name']}: {e}")
+            finally:
+                cls._refresh_tasks.pop(cache_key, None)
+
+        cls._refresh_tasks[cache_key] = asyncio.create_task(refresh())
+
     @classmethod
     async def list_models(cls):
-        """Display available models and their status with detailed messages"""
+        """Display available models and their status with detailed messages.
+
+        Cached verification results are shown immediately; stale entries are
+        refreshed in the background and cache misses are verified concurrently.
+        """
         print("\nVerifying API keys...")
         model_statuses = {}
+        messages = {}
+        misses = []
 
         for id, model in cls.MODELS.items():
-            if os.getenv(model["key_env"]):
-                is_valid, message = await cls.verify_api_key(id)
-                model_statuses[id] = is_valid
-                if not is_valid:
-                    print(f"Warning: {model['name']} - {message}")
-            else:
+            api_key = os.getenv(model["key_env"])
+            if not api_key:
                 model_statuses[id] = False
+                continue
+
+            cached = cls._get_cached_verification(id, api_key)
+            if cached is None:
+                misses.append(id)
+                continue
+
+            is_valid, message, is_fresh = cached
+            model_statuses[id], messages[id] = is_valid, message
+            if not is_fresh:
+                cls._schedule_refresh(id)
+
+        if misses:
+            results = await asyncio.gather(*(cls.verify_api_key_cached(id) for id in misses))
+            for id, (is_valid, message) in zip(misses, results):
+                model_statuses[id], messages[id] = is_valid, message
+
+        for id, is_valid in model_statuses.items():
+            if not is_valid and id in messages:
+                print(f"Warning: {cls.MODELS[id]['name']} - {messages[id]}")
 
         print("\nAvailable AI Models:")
         print("----")
@@ -245,7 +417,7 @@ class LLMManager:
             print("2. Remove API Key")
             print("3. Back to Main Menu")
 
-            choice = input("\nSelect an option (1-3): ").strip()
+            choice = (await ainput("\nSelect an option (1-3): ")).strip()
 
             if choice == "1":
                 await cls.add_update_api_key()
@@ -260,7 +432,7 @@ class LLMManager:
     async def add_update_api_key(cls):
         """Add or update an API key with validation and safe reversion"""
         model_statuses = await cls.list_models()
-        model_id = input("\nSelect model number to add/update API key: ").strip()
+        model_id = (await ainput("\nSelect model number to add/update API key: ")).strip()
 
         if model_id not in cls.MODELS:
             print("❌ Invalid model selection")
@@ -270,7 +442,7 @@ class LLMManager:
         current_key = os.getenv(model["key_env"])
 
         print(f"\nCurrent API key for {model['name']}: {cls._mask_key(current_key)}")
-        new_key = input(f"Enter new API key for {model['name']} (press Enter to keep current): ").strip()
+        new_key = (await ainput(f"Enter new API key for {model['name']} (press Enter to keep current): ")).strip()
 
         if new_key:
             if not cls._validate_key_format(model["provider"], new_key):
@@ -282,7 +454,7 @@ class LLMManager:
 
                 if await cls._update_env_safely(model["key_env"], new_key):
                     print(f"\nTesting API key for {model['name']}...")
-                    is_valid, message = await cls.verify_api_key(model_id)
+                    is_valid, message = await cls.verify_api_key_cached(model_id, force=True)
                     print(message)
 
                     if not is_valid:
@@ -303,7 +475,7 @@ class LLMManager:
     async def remove_api_key(cls):
         """Remove an API key with confirmation"""
         await cls.list_models()
-        model_id = input("\nSelect model number to remove API key: ").strip()
+        model_id = (await ainput("\nSelect model number to remove API key: ")).strip()
 
         if model_id not in cls.MODELS:
             print("❌ Invalid model selection")
@@ -311,7 +483,7 @@ class LLMManager:
 
         model = cls.MODELS[model_id]
         if os.getenv(model["key_env"]):
-            confirm_remove = input(f"⚠️ Are you sure you want to remove the API key for {model['name']}? (yes/no): ").strip().lower()
+            confirm_remove = (await ainput(f"⚠️ Are you sure you want to remove the API key for {model['name']}? (yes/no): ")).strip().lower()
             if confirm_remove == 'yes':
                 try:
                     if await cls._update_env_safely(model["key_env"], ""):
@@ -340,184 +512,295 @@ class LLMManager:
             
         return cls._validate_key_format(config["provider"], api_key)
 
+def _format_action(action) -> str:
+    """Render an agent action such as {"click_element": {"index": 5}} as click_element(index=5)"""
+    for name, params in action.model_dump(exclude_unset=True).items():
+        args = ", ".join(f"{key}={value!r}" for key, value in (params or {}).items())
+        return f"{name}({args})"
+    return "unknown action"
+
 class BrowserAutomation:
-    def __init__(self):
-        self.browser: Browser = None
-        self.context: BrowserContext = None
-        self._init_lock = threading.Lock()
+    """Runs agent tasks on contexts leased from a shared browser context pool.
+
+    All Playwright objects live on a dedicated browser event loop running in
+    its own thread. Public coroutines can be awaited from any event loop (the
+    terminal loop or the Gradio thread); the work is handed off to the browser
+    loop and the result is awaited without blocking the caller's loop.
+    """
+
+    def __init__(self, pool: Optional[BrowserContextPool] = None, artifacts: Optional[ArtifactStore] = None,
+                 sessions: Optional[SessionStore] = None):
+        self.pool = pool or BrowserContextPool.from_env()
+        self.artifacts = artifacts or ArtifactStore()
+        self.sessions = sessions or SessionStore()
+        self.cold_start_seconds: Optional[float] = None
+        # Default actions plus file uploads from UPLOAD_DIR; built on the first task
+        self._controller = None
+        # Guards creation of the loop and the init future only; never held across an await
+        self._lock = threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._init_future: Optional[concurrent.futures.Future] = None
+
+    def _browser_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the event loop that owns the browsers, starting it on first use"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="browser-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    async def _in_browser_loop(self, coro):
+        """Run coro on the browser loop and await its result from the caller's loop"""
+        loop = self._browser_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _launch(self):
+        started = time.perf_counter()
+        try:
+            await self.pool.start()
+        except Exception as e:
+            logger.error(f"Error initializing browser: {str(e)}")
+            raise
+        self.cold_start_seconds = time.perf_counter() - started
+        logger.info(f"Browser pool initialized successfully (cold start {self.cold_start_seconds:.2f}s)")
 
     async def initialize(self):
-        with self._init_lock:
-            if self.browser and self.context:
-                return
+        """Start the browser pool; concurrent callers on any loop share one in-flight launch"""
+        if self.pool.started:
+            return
 
-            try:
-                if not self.browser:
-                    self.browser = Browser()
-                if not self.context:
-                    self.context = await self.browser.new_context()
-                logger.info("Browser and context initialized successfully")
-            except Exception as e:
-                logger.error(f"Error initializing browser: {str(e)}")
-                raise
+        with self._lock:
+            future = self._init_future
+            if future is None or (future.done() and (future.cancelled() or future.exception())):
+                future = asyncio.run_coroutine_threadsafe(self._launch(), self._browser_loop())
+                self._init_future = future
+
+        # Shield so that one cancelled caller does not cancel the launch for everyone else
+        await asyncio.shield(asyncio.wrap_future(future))
+
+    async def acquire_context(self):
+        """Lease a context that the caller keeps across tasks (e.g. one web UI session) until release_context"""
+        await self.initialize()
+        return await self._in_browser_loop(self.pool.acquire())
+
+    async def release_context(self, context, reset_policy: Optional[str] = RESET_RECREATE):
+        """Return a context from acquire_context; by default it is recreated so no state reaches the next user"""
+        if self.pool.started:
+            await self._in_browser_loop(self.pool.release(context, reset_policy))
 
     async def cleanup(self):
+        with self._lock:
+            if self._init_future is None and not self.pool.started:
+                return
+            self._init_future = None
+
         try:
-            if self.context:
-                await self.context.close()
-                self.context = None
-            if self.browser:
-                await self.browser.close()
-                self.browser = None
+            await self._in_browser_loop(self.pool.close())
             logger.info("Browser resources cleaned up")
         except Exception as e:
             logger.error(f"Error during browser cleanup: {str(e)}")
 
-    async def run_task(self, task: str, model_id: str, message_queue: asyncio.Queue = None, screenshot_queue: asyncio.Queue = None):
-        """Execute a browser automation task"""
+    async def run_task(self, task: str, model_id: str, message_queue: asyncio.Queue = None,
+                       screenshot_queue: asyncio.Queue = None, reset_policy: Optional[str] = None,
+                       stream_steps: bool = True, fallback_models: Optional[List[str]] = None,
+                       route_mode: Optional[str] = None, session: Optional[str] = None,
+                       session_sites: Optional[List[str]] = None,
+                       budget: Optional[Union[TaskBudget, Dict[str, Any]]] = None,
+                       context=None) -> TaskArtifacts:
+        """Execute a browser automation task on a leased browser context.
+
+        Each task gets its own artifact directory (recording, step screenshots,
+        history JSON and timing), which is returned. With stream_steps, every
+        agent step puts its action, URL and extracted content on message_queue
+        as soon as it happens, instead of one message at the end. Step
+        screenshots and the final recording from the task's own directory are
+        put on screenshot_queue. With fallback_models, agent steps are routed
+        along [model_id, *fallback_models] (route_mode "fallback" or "hedge").
+        With session, the named session profile (cookies and localStorage) is
+        restored into the context first and saved again, scoped to
+        session_sites, once the task succeeds. budget caps steps, tokens,
+        estimated cost and wall time (unset caps default to TASK_MAX_*); a task
+        that hits one ends with status "stopped" and its partial results. The
+        step, token and cost caps are checked between steps, so every step that
+        ran is kept; the time limit also stops a step that is still running.
+        With context (from acquire_context), the task runs on that context
+        instead of leasing one, and the caller keeps it.
+        """
+        caller_loop = asyncio.get_running_loop()
+
+        def emit(queue: Optional[asyncio.Queue], item):
+            # Queues belong to the caller's loop, so hand items back to it
+            if queue is not None:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        budget = TaskBudget.coerce(budget)
+        await self.initialize()
+        return await self._in_browser_loop(
+            self._run_task(task, model_id, emit, message_queue, screenshot_queue, reset_policy, stream_steps,
+                           fallback_models, route_mode, session, session_sites, budget, context))
+
+    async def _run_task(self, task: str, model_id: str, emit, message_queue, screenshot_queue,
+                        reset_policy: Optional[str], stream_steps: bool,
+                        fallback_models: Optional[List[str]], route_mode: Optional[str],
+                        session: Optional[str], session_sites: Optional[List[str]],
+                        budget: TaskBudget, owned_context=None) -> TaskArtifacts:
+        artifacts = self.artifacts.create(task=task, model=LLMManager.MODELS.get(model_id, {}).get("name"),
+                                          fallback_models=fallback_models, route_mode=route_mode, session=session,
+                                          budget=budget.to_dict())
+        status = "failed"
+        # Everything logged while this task runs, including by the agent, is tagged with its id
+        task_id_var.set(artifacts.task_id)
+        task_logs.open(artifacts.task_id, artifacts.log_path)
+        task_metrics = metrics.TaskMetrics()
+        metrics.current_task.set(task_metrics)
+        started = time.monotonic()
+        stop_reason: Optional[str] = None
+        deadline = None
         try:
-            await self.initialize()
-            llm = LLMManager.get_llm(model_id)
-
-            # Create the agent
-            agent = Agent(
-                task=task,
-                llm=llm,
-                browser=self.browser,
-                browser_context=self.context
-            )
-
-            logger.info(f"Starting task execution with {LLMManager.MODELS[model_id]['name']}")
-            await agent.run()
+            from browser_use import Agent
+            from upload_actions import build_controller, upload_progress
+            adopt_logger("browser_use")
+            if self._controller is None:
+                self._controller = build_controller()
+            # Upload actions report per-file progress alongside the step messages
+            upload_progress.set(lambda line: emit(message_queue, line))
+
+            if fallback_models:
+                llm = LLMManager.get_router([model_id, *fallback_models], route_mode)
+            else:
+                llm = LLMManager.get_llm(model_id)
+            reported_steps = 0
+
+            def report_results(history):
+                # Action results only land in the history once the step has finished
+                nonlocal reported_steps
+                for item in history[reported_steps:]:
+                    for result in item.result:
+                        if result.extracted_content:
+                            emit(message_queue, f"  ↳ {result.extracted_content}")
+                        if result.error:
+                            emit(message_queue, f"  ⚠️ {result.error}")
+                reported_steps = len(history)
+
+            recorder = recording.FrameRecorder(artifacts) if recording.RECORDING_MODE == "frames" else None
+
+            def stop(reason: str):
+                nonlocal stop_reason
+                if stop_reason is None:
+                    stop_reason = reason
+                    logger.info(f"Stopping task {artifacts.task_id}: {reason}")
+                    emit(message_queue, f"⏹ Stopping: {reason}")
+                    agent.stop()
+
+            async def on_step(state, model_output, n_steps: int):
+                # browser-use counts from 1 and increments before calling back, so this is step n_steps - 1
+                step = n_steps - 1
+                step_var.set(step)
+                actions = ", ".join(_format_action(a) for a in model_output.action) if model_output else "no action"
+                if recorder and state.screenshot:
+                    # Encoding happens on the recorder's thread pool, off the browser loop
+                    recorder.submit(step, state.screenshot, state.url, actions,
+                                    on_saved=lambda path: emit(screenshot_queue, str(path)))
+                if stream_steps:
+                    report_results(agent.state.history.history)
+                    emit(message_queue, f"Step {step} | {state.url} | {actions}")
+                    if model_output and model_output.current_state.next_goal:
+                        emit(message_queue, f"  Goal: {model_output.current_state.next_goal}")
+                    emit(message_queue, format_usage(step, task_metrics.input_tokens, task_metrics.output_tokens,
+                                                     task_metrics.cost, budget))
+
+            if session:
+                # Never hand a context carrying this profile's logins to another task
+                reset_policy = RESET_RECREATE
+                self.sessions.path(session)  # validate the name before leasing
+
+            # A caller-owned context is used as is and stays with the caller afterwards
+            lease = nullcontext(owned_context) if owned_context is not None else self.pool.lease(reset_policy)
+            async with lease as context:
+                if session and await self.sessions.restore(session, context):
+                    emit(message_queue, f"Restored session '{session}'")
+                    task = (f"{task}\n\nThe browser already has the saved '{session}' session. If a site shows "
+                            f"you as logged in, skip its login steps.")
+
+                # Create the agent
+                agent = Agent(
+                    task=task,
+                    llm=llm,
+                    browser=context.browser,
+                    browser_context=context,
+                    controller=self._controller,
+                    generate_gif=str(artifacts.recording_path) if recording.RECORDING_MODE == "gif" else False,
+                    register_new_step_callback=on_step,
+                    # The client's rate limiter does the backing off, so the agent can retry sooner and longer
+                    max_failures=AGENT_MAX_FAILURES,
+                    retry_delay=AGENT_RETRY_DELAY
+                )
 
-            if message_queue:
-                await message_queue.put(f"Task executed successfully")
+                logger.info(f"Starting task {artifacts.task_id} with {LLMManager.MODELS[model_id]['name']}")
+                uninstrument = metrics.instrument_agent(agent, context)
+                # Checked once a step has finished, so a stopped task keeps that step's actions
+                stop_between_steps(agent, lambda: budget.exceeded(task_metrics.total_tokens, task_metrics.cost,
+                                                                  started), stop)
+                if budget.max_seconds is not None:
+                    # Hard deadline for a step that is still running when time is up
+                    remaining = max(0.0, budget.max_seconds - (time.monotonic() - started))
+                    deadline = asyncio.get_running_loop().call_later(
+                        remaining, stop, f"time limit of {budget.max_seconds:.0f}s reached")
+                try:
+                    history = await agent.run(max_steps=budget.max_steps or DEFAULT_MAX_STEPS)
+                finally:
+                    uninstrument()
+                if stop_reason is None and not history.is_done():
+                    stop_reason = budget.steps_used_up(len(history.history))
+
+                # A login that ended with done(success=False) must not overwrite a good stored profile
+                if session and history.is_successful() and stop_reason is None:
+                    try:
+                        await self.sessions.save(session, context, session_sites)
+                        emit(message_queue, f"Saved session '{session}'")
+                    except Exception as e:
+                        logger.error(f"Error saving session {session!r}: {str(e)}")
+
+            if recorder:
+                await recorder.wait()
+            artifacts.save_history(history)
+            if stream_steps:
+                report_results(history.history)
+            emit(message_queue, format_usage(len(history.history), task_metrics.input_tokens,
+                                             task_metrics.output_tokens, task_metrics.cost, budget))
+            if stop_reason:
+                emit(message_queue, f"Task stopped: {stop_reason}. Partial results are above.")
+            else:
+                emit(message_queue, f"Task executed successfully")
+            if fallback_models:
+                answers = ", ".join(f"{LLMManager.MODELS[id]['name']} {count}" for id, count in llm.answered_by.items())
+                emit(message_queue, f"Steps answered by: {answers}")
 
-            # Check for agent_history.gif and send it to the screenshot queue
-            gif_path = os.path.join(os.getcwd(), "agent_history.gif")
-            if os.path.exists(gif_path) and screenshot_queue:
-                await screenshot_queue.put(gif_path)
+            gif_path = artifacts.recording()
+            if gif_path:
+                emit(screenshot_queue, str(gif_path))
 
-            logger.info("Task completed successfully")
+            status = "stopped" if stop_reason else "done"
+            artifacts.finish(status, steps=len(history.history), final_result=history.final_result(),
+                             stop_reason=stop_reason, timings=task_metrics.summary())
+            logger.info(f"Task {artifacts.task_id} {'stopped: ' + stop_reason if stop_reason else 'completed successfully'}")
+            return artifacts
 
         except Exception as e:
             logger.error(f"Error during task execution: {str(e)}")
+            artifacts.finish(status, error=str(e), timings=task_metrics.summary())
             raise
-
-async def main_menu():
-    """Main program loop for terminal interface"""
-    automation = BrowserAutomation()
-
-    try:
-        # Ask if the user wants to enable Gradio
-        use_gradio = input("\nDo you want to enable the Gradio interface? (y/n): ").strip().lower()
-        enable_gradio = use_gradio == 'y'
-
-        if enable_gradio:
-            os.environ["ENABLE_GRADIO"] = "true"
-            print("\nEnabling Gradio interface...")
-        else:
-            os.environ["ENABLE_GRADIO"] = "false"
-            print("\nGradio interface disabled.")
-
-        while True:
-            print("\n=== Browser Automation System ===")
-            print("\nAvailable Actions:")
-            print("1. Execute Browser Task")
-            print("2. Manage API Keys")
-            print("3. Exit")
-
-            # Print a separator to distinguish the terminal interface from the Gradio output
-            if enable_gradio:
-                print("\n--- Gradio interface running in the background. ---")
-                print("(Enter your option after the Gradio information below)")
-
-            choice = input("\nSelect action (1-3): ").strip()
-
-            if choice == "1":
-                model_statuses = await LLMManager.list_models()
-                model_id = input("\nSelect AI model number (1-3): ").strip()
-
-                if model_id not in LLMManager.MODELS:
-                    print("\n❌ Invalid model selection. Please try again.")
-                    continue
-
-                if not model_statuses.get(model_id, False):
-                    print(f"\n❌ Invalid or missing API key for {LLMManager.MODELS[model_id]['name']}")
-                    print("Please set up your API key first using option 2")
-                    continue
-
-                print(f"\nUsing {LLMManager.MODELS[model_id]['name']} for task execution")
-                print("\nExample tasks:")
-                print("- Go to wordpress order section of website.com login with ID:xxx Password:xxx")
-                print("- Login to GitHub with username:xxx password:xxx and check notifications")
-
-                while True:
-                    task = input("\nEnter your task (or type 'exit' to go back to the main menu): ").strip()
-                    if task.lower() == "exit":
-                        print("\nReturning to the main menu...")
-                        break
-
-                    if not task:
-                        print("\n❌ Task cannot be empty")
-                        continue
-
-                    try:
-                        print("\nExecuting task...")
-                        # Create message and screenshot queues
-                        message_queue = asyncio.Queue()
-                        screenshot_queue = asyncio.Queue()
-
-                        # Run task with queues
-                        await automation.run_task(
-                            task,
-                            model_id,
-                            message_queue=message_queue,
-                            screenshot_queue=screenshot_queue
-                        )
-
-                        # Get messages and screenshots
-                        messages = []
-                        while not message_queue.empty():
-                            messages.append(await message_queue.get())
-
-                        latest_screenshot = None
-                        while not screenshot_queue.empty():
-                            latest_screenshot = await screenshot_queue.get()
-
-                        print("\n✅ Task completed successfully")
-                        print("\n".join(messages))
-
-                        # Ask if the user wants to perform another task
-                        another_task = input("\nDo you want to perform another task? (y/n): ").strip().lower()
-                        if another_task == 'n':
-                            print("\nReturning to the main menu...")
-                            break
-                        elif another_task != 'y':
-                            print("\n❌ Invalid input. Returning to the main menu...")
-                            break
-
-                    except Exception as e:
-                        print(f"\n❌ Error executing task: {str(e)}")
-                        break
-
-            elif choice == "2":
-                await LLMManager.manage_api_keys()
-
-            elif choice == "3":
-                print("\nExiting program...")
-                await automation.cleanup()
-                break
-
-            else:
-                print("\n❌ Invalid choice. Please select 1-3.")
-
-    except KeyboardInterrupt:
-        print("\n\nProgram interrupted by user")
-        await automation.cleanup()
-    except Exception as e:
-        logger.error(f"Unexpected error in main_menu: {str(e)}")
-        await automation.cleanup()
+        finally:
+            if deadline:
+                deadline.cancel()
+            metrics.TASK_SECONDS.observe(artifacts.metadata.get("duration_seconds", 0), status=status)
+            task_logs.close_task(artifacts.task_id)
+            self.artifacts.release(artifacts)
 
 def main():
     """Entry point of the application"""
@@ -526,10 +809,19 @@ def main():
 
         # Create instances
         automation = BrowserAutomation()
+        # One scheduler shared by the terminal and Gradio front ends
+        scheduler = TaskScheduler(
+            automation,
+            model_limits={id: model["max_concurrency"] for id, model in LLMManager.MODELS.items()
+                          if model.get("max_concurrency")},
+            # Beyond this many waiting tasks, new submissions are rejected instead of queued
+            max_queued=int(os.getenv("SCHEDULER_MAX_QUEUED", "50")) or None
+        )
+        metrics.register_collector(scheduler.metric_samples)
 
         # Run the terminal interface in the main thread
         async def run_with_gradio():
-            await main_menu(automation)
+            await main_menu(automation, scheduler)
 
         asyncio.run(run_with_gradio())
 
@@ -539,25 +831,129 @@ def main():
         logger.error(f"Fatal error in main: {str(e)}")
         print("Program terminated due to an error")
 
-async def main_menu(automation):
-    """Main program loop for terminal interface"""
+class TerminalTasks:
+    """Runs tasks submitted from the terminal as background asyncio tasks and prints their steps live"""
+
+    def __init__(self, scheduler: TaskScheduler):
+        self.scheduler = scheduler
+        self._tasks: Dict[int, Dict[str, Any]] = {}
+        self._next_number = 1
+
+    def submit(self, task: str, model_id: str, **run_kwargs) -> int:
+        number = self._next_number
+        self._next_number += 1
+        info = {
+            "task": task,
+            "model": LLMManager.MODELS[model_id]["name"],
+            "status": "running",
+            "started": time.monotonic(),
+            "artifacts": None,
+        }
+        info["handle"] = asyncio.create_task(self._run(number, task, model_id, info, run_kwargs))
+        self._tasks[number] = info
+        return number
+
+    async def _run(self, number: int, task: str, model_id: str, info: Dict[str, Any], run_kwargs: Dict[str, Any]):
+        prefix = f"[#{number}]"
+        last_position = None
+        try:
+            async for kind, item in self.scheduler.stream_task(task, model_id, submitter="terminal", **run_kwargs):
+                if kind == "queued":
+                    position = self.scheduler.position(item)
+                    if position and position != last_position:
+                        print(f"{prefix} {self.scheduler.describe_position(item)}")
+                    last_position = position
+                elif kind == "message":
+                    print(f"{prefix} {item}")
+                elif kind == "artifacts":
+                    info["artifacts"] = item
+            metadata = info["artifacts"].metadata if info["artifacts"] else {}
+            if metadata.get("status") == "stopped":
+                info["status"] = "stopped"
+                print(f"\n{prefix} ⏹ Task stopped: {metadata.get('stop_reason')}")
+            else:
+                info["status"] = "done"
+                print(f"\n{prefix} ✅ Task completed successfully")
+            if info["artifacts"]:
+                print(f"{prefix} Artifacts saved to {info['artifacts'].path}")
+                timings = info["artifacts"].metadata.get("timings")
+                if timings:
+                    print(f"{prefix} Where the time went:")
+                    for line in metrics.format_summary(timings):
+                        print(f"{prefix}   {line}")
+        except asyncio.CancelledError:
+            info["status"] = "cancelled"
+            raise
+        except Exception as e:
+            info["status"] = "failed"
+            print(f"\n{prefix} ❌ Error executing task: {str(e)}")
+        finally:
+            info["elapsed"] = time.monotonic() - info["started"]
+
+    def running(self) -> int:
+        return sum(1 for info in self._tasks.values() if info["status"] == "running")
+
+    def print_status(self):
+        if not self._tasks:
+            print("\nNo tasks submitted yet")
+            return
+        print("\n=== Tasks ===")
+        for number, info in self._tasks.items():
+            elapsed = info.get("elapsed", time.monotonic() - info["started"])
+            print(f"#{number} [{info['status']}] {info['model']} {elapsed:.0f}s - {info['task'][:60]}")
+
+        scheduler_metrics = self.scheduler.metrics()
+        counts = ", ".join(f"{count} {status}" for status, count in scheduler_metrics["counts"].items() if count)
+        print(f"\nScheduler (all front ends): {counts}")
+        for name in ("queue_wait", "run_time"):
+            if scheduler_metrics[name]:
+                stats = scheduler_metrics[name]
+                print(f"{name.replace('_', ' ')}: avg {stats['avg']:.1f}s, p95 {stats['p95']:.1f}s")
+
+        for provider, usage in sorted(metrics.usage_by_provider().items()):
+            print(f"{provider}: {int(usage['input_tokens'])} input / {int(usage['output_tokens'])} output tokens, "
+                  f"~${usage['cost']:.4f}")
+
+        for model_id, health in llm_router.health_report().items():
+            latency = f"{health['latency']:.1f}s" if health["latency"] is not None else "-"
+            state = "healthy" if health["healthy"] else "cooling down"
+            print(f"{LLMManager.MODELS[model_id]['name']}: {state}, latency {latency}, "
+                  f"errors {health['error_rate']:.0%} over {health['calls']} routed calls")
+
+    async def cancel_all(self):
+        handles = [info["handle"] for info in self._tasks.values() if not info["handle"].done()]
+        for handle in handles:
+            handle.cancel()
+        await asyncio.gather(*handles, return_exceptions=True)
+
+
+async def main_menu(automation, scheduler: TaskScheduler):
+    """Main program loop for terminal interface.
+
+    Prompts are awaited through the async console, so the event loop keeps
+    running background work (task progress, key verification) while waiting
+    for input. Tasks run in the background; several can be queued at once.
+    """
+    tasks = TerminalTasks(scheduler)
 
     try:
         # Ask if the user wants to enable Gradio
-        use_gradio = input("\nDo you want to enable the Gradio interface? (y/n): ").strip().lower()
+        use_gradio = (await ainput("\nDo you want to enable the Gradio interface? (y/n): ")).strip().lower()
         enable_gradio = use_gradio == 'y'
 
         if enable_gradio:
             os.environ["ENABLE_GRADIO"] = "true"
             print("\nEnabling Gradio interface...")
             from gradio_interface import create_gradio_interface  # Import here to avoid errors when disabled
-            demo = create_gradio_interface(LLMManager, automation)
+            demo = create_gradio_interface(LLMManager, automation, scheduler)
             gradio_thread = threading.Thread(
                 target=lambda: demo.launch(server_name="0.0.0.0", server_port=7860, share=True),
                 daemon=True
             )
             gradio_thread.start()
             print("\nGradio interface running in the background.")
+            if metrics.start_server():
+                print(f"Metrics endpoint at http://localhost:{metrics.METRICS_PORT}/metrics")
         else:
             os.environ["ENABLE_GRADIO"] = "false"
             print("\nGradio interface disabled.")
@@ -567,18 +963,19 @@ async def main_menu(automation):
             print("\nAvailable Actions:")
             print("1. Execute Browser Task")
             print("2. Manage API Keys")
-            print("3. Exit")
+            print(f"3. Show Tasks ({tasks.running()} running)")
+            print("4. Exit")
 
             # Print a separator to distinguish the terminal interface from the Gradio output
             if enable_gradio:
                 print("\n--- Gradio interface running in the background. ---")
                 print("(Enter your option after the Gradio information below)")
 
-            choice = input("\nSelect action (1-3): ").strip()
+            choice = (await ainput("\nSelect action (1-4): ")).strip()
 
             if choice == "1":
                 model_statuses = await LLMManager.list_models()
-                model_id = input("\nSelect AI model number (1-3): ").strip()
+                model_id = (await ainput("\nSelect AI model number (1-3): ")).strip()
 
                 if model_id not in LLMManager.MODELS:
                     print("\n❌ Invalid model selection. Please try again.")
@@ -589,13 +986,46 @@ async def main_menu(automation):
                     print("Please set up your API key first using option 2")
                     continue
 
+                route = {}
+                fallbacks = (await ainput("Fallback models in order (e.g. 2,3), or Enter for none: ")).strip()
+                fallback_models = [id.strip() for id in fallbacks.split(",") if id.strip() and id.strip() != model_id]
+                unusable = [id for id in fallback_models if not model_statuses.get(id, False)]
+                if unusable:
+                    print(f"\n❌ No usable API key for fallback model(s): {', '.join(unusable)}")
+                    continue
+                if fallback_models:
+                    hedge = (await ainput("Send each step to the first two models at once? (y/n): ")).strip().lower()
+                    route = {"fallback_models": fallback_models, "route_mode": "hedge" if hedge == "y" else "fallback"}
+
+                session = (await ainput("Session profile to reuse logins from (Enter for none): ")).strip()
+                if session:
+                    try:
+                        automation.sessions.path(session)
+                    except ValueError as e:
+                        print(f"\n❌ {e}")
+                        continue
+                    sites = (await ainput("Sites to keep in it, e.g. github.com (Enter for all): ")).strip()
+                    route["session"] = session
+                    route["session_sites"] = [site.strip() for site in sites.split(",") if site.strip()] or None
+
+                caps = (await ainput("Budget caps, e.g. steps=30 cost=0.50 tokens=200000 minutes=10 "
+                                     "(Enter for defaults): ")).strip()
+                try:
+                    route["budget"] = TaskBudget.parse(caps)
+                except ValueError as e:
+                    print(f"\n❌ Invalid budget: {e}")
+                    continue
+
                 print(f"\nUsing {LLMManager.MODELS[model_id]['name']} for task execution")
+                if fallback_models:
+                    names = ", ".join(LLMManager.MODELS[id]["name"] for id in fallback_models)
+                    print(f"Falling back to {names} ({route['route_mode']} mode)")
                 print("\nExample tasks:")
                 print("- Go to wordpress order section of website.com login with ID:xxx Password:xxx")
                 print("- Login to GitHub with username:xxx password:xxx and check notifications")
 
                 while True:
-                    task = input("\nEnter your task (or type 'exit' to go back to the main menu): ").strip()
+                    task = (await ainput("\nEnter your task (or type 'exit' to go back to the main menu): ")).strip()
                     if task.lower() == "exit":
                         print("\nReturning to the main menu...")
                         break
@@ -604,61 +1034,34 @@ async def main_menu(automation):
                         print("\n❌ Task cannot be empty")
                         continue
 
-                    try:
-                        print("\nExecuting task...")
-                        # Create message and screenshot queues
-                        message_queue = asyncio.Queue()
-                        screenshot_queue = asyncio.Queue()
-
-                        # Run task with queues
-                        await automation.run_task(
-                            task,
-                            model_id,
-                            message_queue=message_queue,
-                            screenshot_queue=screenshot_queue
-                        )
-
-                        # Get messages and screenshots
-                        messages = []
-                        while not message_queue.empty():
-                            messages.append(await message_queue.get())
-
-                        latest_screenshot = None
-                        while not screenshot_queue.empty():
-                            latest_screenshot = await screenshot_queue.get()
-
-                        print("\n✅ Task completed successfully")
-                        print("\n".join(messages))
-
-                        # Ask if the user wants to perform another task
-                        another_task = input("\nDo you want to perform another task? (y/n): ").strip().lower()
-                        if another_task == 'n':
-                            print("\nReturning to the main menu...")
-                            break
-                        elif another_task != 'y':
-                            print("\n❌ Invalid input. Returning to the main menu...")
-                            break
-
-                    except Exception as e:
-                        print(f"\n❌ Error executing task: {str(e)}")
-                        break
+                    number = tasks.submit(task, model_id, **route)
+                    print(f"\nTask #{number} started in the background; its steps are printed as they happen.")
+                    print("You can enter another task while it runs.")
 
             elif choice == "2":
                 await LLMManager.manage_api_keys()
 
             elif choice == "3":
+                tasks.print_status()
+
+            elif choice == "4":
                 print("\nExiting program...")
+                if tasks.running():
+                    print(f"Cancelling {tasks.running()} running task(s)...")
+                await tasks.cancel_all()
                 await automation.cleanup()
                 break
 
             else:
-                print("\n❌ Invalid choice. Please select 1-3.")
+                print("\n❌ Invalid choice. Please select 1-4.")
 
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, EOFError):
         print("\n\nProgram interrupted by user")
+        await tasks.cancel_all()
         await automation.cleanup()
     except Exception as e:
         logger.error(f"Unexpected error in main_menu: {str(e)}")
+        await tasks.cancel_all()
         await automation.cleanup()
 
 if __name__ == "__main__":
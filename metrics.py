@@ -0,0 +1,321 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_text(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_label_text(key)} {_format_number(value)}" for key, value in self._values.items()]
+
+    def values(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., sum, count]
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(key, ('le', _format_number(bound)))} {int(count)}")
+                lines.append(f"{self.name}_bucket{_label_text(key, ('le', '+Inf'))} {int(series[-1])}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {_format_number(round(series[-2], 6))}")
+                lines.append(f"{self.name}_count{_label_text(key)} {int(series[-1])}")
+        return lines
+
+
+PHASE_SECONDS = Histogram(
+    "browser_agent_phase_seconds",
+    "Time per agent step phase (step, llm, llm_request, dom_extraction, screenshot, actions)")
+LLM_SECONDS = Histogram("browser_agent_llm_request_seconds", "LLM request latency, excluding rate-limit waits")
+LLM_TOKENS = Histogram("browser_agent_llm_tokens", "Tokens per LLM request by direction", TOKEN_BUCKETS)
+LLM_TOKENS_TOTAL = Counter("browser_agent_llm_tokens_total", "Tokens sent and received")
+LLM_COST_TOTAL = Counter("browser_agent_llm_cost_usd_total", "Estimated LLM spend in USD")
+RATE_LIMIT_WAIT_SECONDS = Histogram("browser_agent_rate_limit_wait_seconds", "Time LLM requests waited on the rate limiter")
+BROWSER_LAUNCH_SECONDS = Histogram("browser_launch_seconds", "Browser pool start-up, including pre-warmed contexts")
+CONTEXT_CREATE_SECONDS = Histogram("browser_context_create_seconds", "Time to create and open a browser context")
+TASK_SECONDS = Histogram("browser_agent_task_seconds", "Task wall-clock time by status")
+
+REGISTRY = [PHASE_SECONDS, LLM_SECONDS, LLM_TOKENS, LLM_TOKENS_TOTAL, LLM_COST_TOTAL, RATE_LIMIT_WAIT_SECONDS,
+            BROWSER_LAUNCH_SECONDS, CONTEXT_CREATE_SECONDS, TASK_SECONDS]
+
+# Extra sample sources (e.g. the scheduler's queue gauges), each returning exposition lines
+_collectors: List[Callable[[], List[str]]] = []
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {str(e)}")
+    return "\n".join(lines) + "\n"
+
+
+class TaskMetrics:
+    """Per-task totals of the same measurements, for the end-of-task summary and budget checks"""
+
+    def __init__(self):
+        self.phases: Dict[str, List[float]] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        # model -> {"input_tokens", "output_tokens", "cost"}
+        self.usage: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases.setdefault(phase, []).append(seconds)
+
+    def add_usage(self, model: str, input_tokens: int, output_tokens: int, cost: float):
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost += cost
+            usage = self.usage.setdefault(model, {"input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+            usage["input_tokens"] += input_tokens
+            usage["output_tokens"] += output_tokens
+            usage["cost"] += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = {
+                phase: {
+                    "count": len(values),
+                    "total": round(sum(values), 3),
+                    "avg": round(sum(values) / len(values), 3),
+                    "max": round(max(values), 3),
+                }
+                for phase, values in self.phases.items()
+            }
+            usage = {model: dict(values, cost=round(values["cost"], 6)) for model, values in self.usage.items()}
+            return {"phases": phases, "input_tokens": self.input_tokens, "output_tokens": self.output_tokens,
+                    "cost": round(self.cost, 6), "usage": usage}
+
+
+# Metrics of the task running in the current asyncio task, if any
+current_task: contextvars.ContextVar[Optional[TaskMetrics]] = contextvars.ContextVar("task_metrics", default=None)
+
+
+def observe_phase(phase: str, seconds: float):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+    task_metrics = current_task.get()
+    if task_metrics:
+        task_metrics.add(phase, seconds)
+
+
+def observe_llm(model: str, seconds: float, input_tokens: int, output_tokens: int,
+                provider: str = "", cost: float = 0.0):
+    LLM_SECONDS.observe(seconds, model=model)
+    observe_phase("llm_request", seconds)
+    if input_tokens or output_tokens:
+        LLM_TOKENS.observe(input_tokens, model=model, direction="input")
+        LLM_TOKENS.observe(output_tokens, model=model, direction="output")
+        LLM_TOKENS_TOTAL.inc(input_tokens, provider=provider, model=model, direction="input")
+        LLM_TOKENS_TOTAL.inc(output_tokens, provider=provider, model=model, direction="output")
+        LLM_COST_TOTAL.inc(cost, provider=provider, model=model)
+        task_metrics = current_task.get()
+        if task_metrics:
+            task_metrics.add_usage(model, input_tokens, output_tokens, cost)
+
+
+def usage_by_provider() -> Dict[str, Dict[str, float]]:
+    """Process-wide tokens and estimated cost per provider since start-up"""
+    totals: Dict[str, Dict[str, float]] = {}
+    for key, value in LLM_TOKENS_TOTAL.values().items():
+        labels = dict(key)
+        entry = totals.setdefault(labels["provider"], {"input_tokens": 0, "output_tokens": 0, "cost": 0.0})
+        entry[f"{labels['direction']}_tokens"] += value
+    for key, value in LLM_COST_TOTAL.values().items():
+        labels = dict(key)
+        totals.setdefault(labels["provider"], {"input_tokens": 0, "output_tokens": 0, "cost": 0.0})["cost"] += value
+    return totals
+
+
+def _timed(method, phase: str, on_done: Optional[Callable[[float], None]] = None):
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_phase(phase, elapsed)
+            if on_done:
+                on_done(elapsed)
+    return wrapper
+
+
+def instrument_agent(agent, context) -> Callable[[], None]:
+    """Time the phases of every agent step by wrapping the agent's and context's methods.
+
+    get_state covers DOM extraction plus the screenshot, so the screenshot
+    time measured inside it is subtracted for dom_extraction. Returns a
+    function that removes the wrappers (the context goes back to a pool).
+    """
+    screenshot_seconds = contextvars.ContextVar("screenshot_seconds", default=0.0)
+
+    async def get_state(*args, **kwargs):
+        screenshot_seconds.set(0.0)
+        started = time.perf_counter()
+        try:
+            return await original_get_state(*args, **kwargs)
+        finally:
+            observe_phase("dom_extraction", time.perf_counter() - started - screenshot_seconds.get())
+
+    original_get_state = context.get_state
+    patched = {
+        (agent, "step"): _timed(agent.step, "step"),
+        (agent, "get_next_action"): _timed(agent.get_next_action, "llm"),
+        (agent, "multi_act"): _timed(agent.multi_act, "actions"),
+        (context, "get_state"): get_state,
+        (context, "take_screenshot"): _timed(
+            context.take_screenshot, "screenshot",
+            on_done=lambda elapsed: screenshot_seconds.set(screenshot_seconds.get() + elapsed)),
+    }
+    for (target, name), wrapper in patched.items():
+        setattr(target, name, wrapper)
+
+    def undo():
+        for target, name in patched:
+            # Removing the instance attribute exposes the class method again
+            target.__dict__.pop(name, None)
+    return undo
+
+
+PHASE_LABELS = {
+    "step": "Step total",
+    "llm": "LLM (agent)",
+    "llm_request": "LLM requests",
+    "dom_extraction": "DOM extraction",
+    "screenshot": "Screenshots",
+    "actions": "Actions",
+}
+
+
+def format_summary(summary: Dict[str, Any]) -> List[str]:
+    """Human-readable lines for a TaskMetrics summary"""
+    lines = []
+    for phase, label in PHASE_LABELS.items():
+        stats = summary["phases"].get(phase)
+        if stats:
+            lines.append(f"{label:<15} {stats['total']:7.1f}s total, {stats['avg']:5.2f}s avg, "
+                         f"{stats['max']:5.2f}s max over {stats['count']}")
+    if summary["input_tokens"] or summary["output_tokens"]:
+        lines.append(f"{'Tokens':<15} {summary['input_tokens']} in, {summary['output_tokens']} out, "
+                     f"~${summary.get('cost', 0):.4f}")
+        for model, usage in summary.get("usage", {}).items():
+            lines.append(f"{'  ' + model:<15} {usage['input_tokens']} in, {usage['output_tokens']} out, "
+                         f"~${usage['cost']:.4f}")
+    return lines
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent for the application log
+        pass
+
+
+def start_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread; port 0 disables it"""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics endpoint on port {port}: {str(e)}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
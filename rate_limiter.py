@@ -0,0 +1,267 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough token cost of an image part in a multimodal message
+IMAGE_TOKEN_ESTIMATE = 800
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, shared across threads and event loops"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, rate_scale: float = 1.0) -> float:
+        """Take amount tokens (going into debt if needed) and return seconds to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Never ask for more than a full bucket, or the wait would never end
+            self._tokens -= min(amount, self.capacity)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / (self.rate * rate_scale)
+
+    def debit(self, amount: float):
+        """Adjust for usage that differed from the reserved estimate"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = max(-self.capacity, min(self.capacity, self._tokens - amount))
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider/key, with adaptive backoff.
+
+    A rate-limit error halves the effective rate and blocks new requests for a
+    jittered, exponentially growing delay; each success recovers the rate
+    gradually (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.rate_scale = 1.0
+        self._consecutive_limits = 0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def blocked_for(self) -> float:
+        """Seconds left of the backoff set by the last rate-limit response"""
+        with self._lock:
+            return max(0.0, self._blocked_until - time.monotonic())
+
+    async def acquire(self, estimated_tokens: int = 0) -> float:
+        """Wait until a request of about estimated_tokens may be sent; returns the seconds waited"""
+        with self._lock:
+            wait = max(0.0, self._blocked_until - time.monotonic())
+            scale = self.rate_scale
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1, scale))
+        if self.tokens and estimated_tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens, scale))
+        if wait > 0:
+            logger.info(f"Rate limiter {self.name}: waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+        metrics.RATE_LIMIT_WAIT_SECONDS.observe(wait, provider=self.name)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        if self.tokens and actual_tokens:
+            self.tokens.debit(actual_tokens - estimated_tokens)
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_limits = 0
+            self.rate_scale = min(1.0, self.rate_scale + 0.1)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> float:
+        """Back off after a rate-limit error; returns the delay applied"""
+        with self._lock:
+            self._consecutive_limits += 1
+            self.rate_scale = max(0.1, self.rate_scale / 2)
+            delay = min(self.max_backoff, self.base_backoff * 2 ** (self._consecutive_limits - 1))
+            delay *= random.uniform(0.5, 1.5)
+            if retry_after:
+                delay = max(delay, retry_after)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning(f"Rate limited by {self.name}; backing off {delay:.1f}s "
+                       f"(rate now {self.rate_scale:.0%} of configured)")
+        return delay
+
+
+_limiters: Dict[Tuple[str, str], ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, key_fingerprint: str, limits: Optional[Dict[str, Any]] = None) -> ProviderRateLimiter:
+    """Shared limiter for a provider/key pair, created from the model's rate_limits on first use"""
+    with _limiters_lock:
+        limiter = _limiters.get((provider, key_fingerprint))
+        if limiter is None:
+            limits = limits or {}
+            limiter = ProviderRateLimiter(
+                provider,
+                rpm=limits.get("rpm"),
+                tpm=limits.get("tpm"),
+                base_backoff=limits.get("base_backoff", 1.0),
+                max_backoff=limits.get("max_backoff", 60.0),
+            )
+            _limiters[(provider, key_fingerprint)] = limiter
+        return limiter
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Recognize 429 / quota errors from the OpenAI, Anthropic and Google SDKs, also when wrapped"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = (getattr(error, "status_code", None) or getattr(error, "code", None)
+                  or getattr(getattr(error, "response", None), "status_code", None))
+        if status == 429:
+            return True
+        if type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+            return True
+        message = str(error).lower()
+        if "rate limit" in message or "resource exhausted" in message or "too many requests" in message:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """Rough token count of chat messages (4 characters per token, fixed cost per image)"""
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            total += len(content) // 4
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get("type") == "text":
+                    total += len(part.get("text", "")) // 4
+                elif isinstance(part, dict):
+                    total += IMAGE_TOKEN_ESTIMATE
+                else:
+                    total += len(str(part)) // 4
+    return total
+
+
+def usage_from_result(response) -> Tuple[int, int]:
+    """(input_tokens, output_tokens) reported in an LLMResult, or (0, 0)"""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+    if not input_tokens and response.llm_output:
+        usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+        input_tokens = usage.get("prompt_tokens") or usage.get("input_tokens") or 0
+        output_tokens = usage.get("completion_tokens") or usage.get("output_tokens") or 0
+    return input_tokens, output_tokens
+
+
+class RateLimitCallbackHandler(AsyncCallbackHandler):
+    """Paces chat model calls through a ProviderRateLimiter.
+
+    LangChain awaits on_chat_model_start before sending the request, so the
+    limiter can delay it; usage and rate-limit errors feed back into the limiter.
+    """
+
+    # Inline handlers run in order, so handlers after this one start timing once the wait is over
+    run_inline = True
+
+    def __init__(self, limiter: ProviderRateLimiter):
+        self.limiter = limiter
+        self._estimates: Dict[Any, int] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        estimate = sum(estimate_tokens(batch) for batch in messages)
+        self._estimates[run_id] = estimate
+        await self.limiter.acquire(estimate)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        estimate = self._estimates.pop(run_id, 0)
+        input_tokens, output_tokens = usage_from_result(response)
+        self.limiter.record_usage(estimate, input_tokens + output_tokens)
+        self.limiter.on_success()
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._estimates.pop(run_id, None)
+        if is_rate_limit_error(error):
+            self.limiter.on_rate_limited(_retry_after(error))
+
+
+async def call_with_backoff(call: Callable[[], Awaitable[Any]], limiter: Optional[ProviderRateLimiter] = None,
+                            max_retries: int = 3, base_delay: float = 1.0) -> Any:
+    """Await call(), retrying rate-limit errors with jittered exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limit_error(e):
+                raise
+            if limiter:
+                # The callback handler already recorded the error; wait out the limiter's block
+                delay = limiter.blocked_for()
+            else:
+                delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            await asyncio.sleep(max(delay, base_delay * random.uniform(0.5, 1.5)))
+
+
+class LLMMetricsCallbackHandler(AsyncCallbackHandler):
+    """Records request latency, token usage and estimated cost of chat model calls in metrics"""
+
+    run_inline = True
+
+    def __init__(self, model: str, provider: str = "", cost_per_1k: Optional[Dict[str, float]] = None):
+        self.model = model
+        self.provider = provider
+        self.cost_per_1k = cost_per_1k or {}
+        self._started: Dict[Any, float] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            input_tokens, output_tokens = usage_from_result(response)
+            cost = (input_tokens * self.cost_per_1k.get("input", 0.0)
+                    + output_tokens * self.cost_per_1k.get("output", 0.0)) / 1000
+            metrics.observe_llm(self.model, time.perf_counter() - started, input_tokens, output_tokens,
+                                provider=self.provider, cost=cost)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
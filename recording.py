@@ -0,0 +1,164 @@
+import os
+import io
+import json
+import base64
+import asyncio
+import logging
+import threading
+import multiprocessing
+import concurrent.futures
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from task_artifacts import TaskArtifacts
+
+logger = logging.getLogger(__name__)
+
+# "frames": compressed step frames + manifest (GIF rendered on demand)
+# "gif": let browser-use render the full GIF at the end of every task
+# "none": no recording
+RECORDING_MODE = os.getenv("TASK_RECORDING", "frames")
+FRAME_FORMAT = os.getenv("TASK_FRAME_FORMAT", "webp").lower()
+FRAME_QUALITY = int(os.getenv("TASK_FRAME_QUALITY", "70"))
+FRAME_MAX_WIDTH = int(os.getenv("TASK_FRAME_MAX_WIDTH", "1024"))
+
+_encode_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="frame-encode")
+_gif_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_gif_pool_lock = threading.Lock()
+_gif_jobs: Dict[str, concurrent.futures.Future] = {}
+
+
+class FrameRecorder:
+    """Stores step screenshots of one task as compressed frames plus a small manifest"""
+
+    def __init__(self, artifacts: TaskArtifacts, fmt: str = FRAME_FORMAT,
+                 quality: int = FRAME_QUALITY, max_width: int = FRAME_MAX_WIDTH):
+        if fmt not in ("webp", "jpeg"):
+            raise ValueError(f"Unsupported frame format: {fmt}")
+        self.artifacts = artifacts
+        self.fmt = fmt
+        self.quality = quality
+        self.max_width = max_width
+        self._frames: List[Dict[str, Any]] = []
+        self._pending: List[concurrent.futures.Future] = []
+        self._lock = threading.Lock()
+
+    def add_frame(self, step: int, screenshot_b64: str, url: str = "", actions: str = "") -> Path:
+        """Decode, downscale and encode one screenshot, then update the manifest"""
+        image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+        if image.width > self.max_width:
+            image = image.resize((self.max_width, round(image.height * self.max_width / image.width)))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        path = self.artifacts.frame_path(step, self.fmt)
+        image.save(path, format=self.fmt.upper(), quality=self.quality)
+
+        with self._lock:
+            self._frames.append({
+                "step": step,
+                "file": path.name,
+                "url": url,
+                "actions": actions,
+                "bytes": path.stat().st_size,
+            })
+            self._frames.sort(key=lambda frame: frame["step"])
+            manifest = {"format": self.fmt, "frames": self._frames}
+            self.artifacts.manifest_path.write_text(json.dumps(manifest, indent=2))
+        return path
+
+    def submit(self, step: int, screenshot_b64: str, url: str = "", actions: str = "", on_saved=None):
+        """Encode a frame on the encoder thread pool; on_saved(path) is called when it is written"""
+        future = _encode_pool.submit(self.add_frame, step, screenshot_b64, url, actions)
+
+        def done(f: concurrent.futures.Future):
+            if f.exception():
+                logger.error(f"Error recording frame {step} of task {self.artifacts.task_id}: {f.exception()}")
+            elif on_saved:
+                on_saved(f.result())
+
+        future.add_done_callback(done)
+        self._pending.append(future)
+
+    async def wait(self):
+        """Wait until every submitted frame has been written"""
+        pending, self._pending = self._pending, []
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in pending), return_exceptions=True)
+
+
+def load_manifest(artifacts: TaskArtifacts) -> List[Dict[str, Any]]:
+    """Frame entries of a task's recording, ordered by step"""
+    try:
+        return json.loads(artifacts.manifest_path.read_text())["frames"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return []
+
+
+def frame_at(artifacts: TaskArtifacts, index: int) -> Optional[Dict[str, Any]]:
+    """Frame entry at index (clamped) with its absolute path, without loading the other frames"""
+    frames = load_manifest(artifacts)
+    if not frames:
+        return None
+    index = max(0, min(index, len(frames) - 1))
+    frame = dict(frames[index], index=index, total=len(frames))
+    frame["path"] = str(artifacts.frames_dir / frame["file"])
+    return frame
+
+
+def _encode_gif(frame_paths: List[str], output_path: str, frame_duration_ms: int) -> str:
+    # Runs in a worker process
+    frames = [Image.open(path).convert("P", palette=Image.ADAPTIVE) for path in frame_paths]
+    partial_path = output_path + ".partial"
+    frames[0].save(partial_path, format="GIF", save_all=True, append_images=frames[1:],
+                   duration=frame_duration_ms, loop=0, optimize=True)
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def _get_gif_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _gif_pool
+    with _gif_pool_lock:
+        if _gif_pool is None:
+            # Spawn rather than fork: the parent runs browser and encoder threads
+            _gif_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=int(os.getenv("GIF_WORKERS", "1")),
+                mp_context=multiprocessing.get_context("spawn"))
+        return _gif_pool
+
+
+def render_gif(artifacts: TaskArtifacts, frame_duration_ms: int = 1000) -> concurrent.futures.Future:
+    """Render the task's frames into recording.gif on the GIF worker pool.
+
+    Returns a future resolving to the GIF path. Repeated requests for the same
+    task share one render, and an existing GIF is returned without re-encoding.
+    """
+    pool = _get_gif_pool()
+    # One lock from the lookup to storing the job, so concurrent requests never start two encodes
+    with _gif_pool_lock:
+        job = _gif_jobs.get(artifacts.task_id)
+        if job and not job.done():
+            return job
+
+        if artifacts.recording():
+            job = concurrent.futures.Future()
+            job.set_result(str(artifacts.recording_path))
+            return job
+
+        frame_paths = [str(artifacts.frames_dir / frame["file"]) for frame in load_manifest(artifacts)]
+        if not frame_paths:
+            job = concurrent.futures.Future()
+            job.set_exception(FileNotFoundError(f"No frames recorded for task {artifacts.task_id}"))
+            return job
+
+        job = pool.submit(_encode_gif, frame_paths, str(artifacts.recording_path), frame_duration_ms)
+        _gif_jobs[artifacts.task_id] = job
+    job.add_done_callback(lambda done: _forget_gif_job(artifacts.task_id, done))
+    return job
+
+
+def _forget_gif_job(task_id: str, job: concurrent.futures.Future):
+    with _gif_pool_lock:
+        if _gif_jobs.get(task_id) is job:
+            del _gif_jobs[task_id]
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from browser_use.browser.context import BrowserContext
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "168"))
+
+
+def _matches_site(host: str, sites: Optional[List[str]]) -> bool:
+    """True if host is one of sites or a subdomain of one; no sites means every host"""
+    if not sites:
+        return True
+    host = (host or "").lstrip(".").lower()
+    return any(host == site or host.endswith("." + site) for site in sites)
+
+
+def _normalize_sites(sites: Optional[List[str]]) -> Optional[List[str]]:
+    if not sites:
+        return None
+    normalized = []
+    for site in sites:
+        site = site.strip().lower()
+        # Accept "https://github.com/login" as well as "github.com"
+        if "://" in site:
+            site = urlparse(site).hostname or site
+        if site:
+            normalized.append(site.lstrip("."))
+    return normalized or None
+
+
+def scope_storage_state(state: Dict[str, Any], sites: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only the cookies and localStorage origins that belong to sites, minus expired cookies"""
+    now = time.time()
+    cookies = [
+        cookie for cookie in state.get("cookies", [])
+        if _matches_site(cookie.get("domain", ""), sites)
+        and (cookie.get("expires", -1) in (-1, None) or cookie["expires"] > now)
+    ]
+    origins = [
+        origin for origin in state.get("origins", [])
+        if _matches_site(urlparse(origin.get("origin", "")).hostname, sites) and origin.get("localStorage")
+    ]
+    return {"cookies": cookies, "origins": origins}
+
+
+def _local_storage_script(origins: List[Dict[str, Any]]) -> str:
+    """Init script that seeds localStorage once per origin, leaving later changes by the site alone"""
+    items = {origin["origin"]: {entry["name"]: entry["value"] for entry in origin["localStorage"]}
+             for origin in origins}
+    return f"""
+(() => {{
+    const items = {json.dumps(items)}[window.location.origin];
+    if (!items || window.localStorage.getItem("__session_restored__")) return;
+    for (const [name, value] of Object.entries(items)) window.localStorage.setItem(name, value);
+    window.localStorage.setItem("__session_restored__", "1");
+}})();
+"""
+
+
+class SessionStore:
+    """Named browser session profiles (cookies and localStorage) encrypted at rest.
+
+    Each profile is a Fernet-encrypted file under root holding a Playwright
+    storage state, the sites it is scoped to and an expiry time. The key comes
+    from SESSION_STORE_KEY, or is generated once into root/.key.
+    """
+
+    def __init__(self, root: Optional[str] = None, key: Optional[str] = None,
+                 ttl_hours: float = SESSION_TTL_HOURS):
+        self.root = Path(root or os.getenv("SESSION_STORE_DIR", "sessions")).absolute()
+        self.ttl = ttl_hours * 3600
+        self._key = key or os.getenv("SESSION_STORE_KEY")
+        self._fernet = None
+        self._lock = threading.Lock()
+
+    def _cipher(self):
+        # cryptography is only imported once a session is actually used
+        from cryptography.fernet import Fernet
+
+        with self._lock:
+            if self._fernet is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                key = self._key
+                if not key:
+                    key_path = self.root / ".key"
+                    if not key_path.exists():
+                        logger.warning(f"SESSION_STORE_KEY is not set; generating a key in {key_path}")
+                        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                        with os.fdopen(fd, "wb") as f:
+                            f.write(Fernet.generate_key())
+                    key = key_path.read_bytes().strip()
+                self._fernet = Fernet(key)
+            return self._fernet
+
+    def path(self, name: str) -> Path:
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name) or name.startswith("."):
+            raise ValueError(f"Invalid session name: {name!r}")
+        return self.root / f"{name}.session"
+
+    def load(self, name: str) -> Optional[Dict[str, Any]]:
+        """Decrypt a profile; expired or unreadable profiles are treated as missing"""
+        path = self.path(name)
+        if not path.exists():
+            return None
+
+        from cryptography.fernet import InvalidToken
+
+        try:
+            profile = json.loads(self._cipher().decrypt(path.read_bytes()))
+        except (InvalidToken, ValueError) as e:
+            logger.warning(f"Ignoring unreadable session {name!r}: {type(e).__name__}")
+            return None
+        if profile.get("expires_at", 0) < time.time():
+            logger.info(f"Session {name!r} expired; deleting it")
+            self.delete(name)
+            return None
+        return profile
+
+    def store(self, name: str, storage_state: Dict[str, Any], sites: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Encrypt and write a profile atomically, keeping only the cookies/origins of sites"""
+        sites = _normalize_sites(sites)
+        now = time.time()
+        profile = {
+            "name": name,
+            "sites": sites,
+            "saved_at": now,
+            "expires_at": now + self.ttl,
+            "storage_state": scope_storage_state(storage_state, sites),
+        }
+        path = self.path(name)
+        token = self._cipher().encrypt(json.dumps(profile).encode("utf-8"))
+        partial = path.with_suffix(".partial")
+        fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(token)
+        os.replace(partial, path)
+        return profile
+
+    def delete(self, name: str) -> bool:
+        try:
+            self.path(name).unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Name, sites and expiry of every readable, unexpired profile"""
+        if not self.root.exists():
+            return []
+        profiles = []
+        for path in sorted(self.root.glob("*.session")):
+            profile = self.load(path.stem)
+            if profile:
+                profiles.append({key: profile[key] for key in ("name", "sites", "saved_at", "expires_at")})
+        return profiles
+
+    async def save(self, name: str, context: "BrowserContext", sites: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Save the context's cookies and localStorage; sites defaults to the profile's existing scope"""
+        session = await context.get_session()
+        state = await session.context.storage_state()
+        if sites is None:
+            existing = self.load(name)
+            sites = existing.get("sites") if existing else None
+        profile = self.store(name, state, sites)
+        state = profile["storage_state"]
+        logger.info(f"Saved session {name!r}: {len(state['cookies'])} cookie(s), "
+                    f"{len(state['origins'])} origin(s) with localStorage")
+        return profile
+
+    async def restore(self, name: str, context: "BrowserContext") -> bool:
+        """Load a profile into a context before its first navigation; False if there is none"""
+        profile = self.load(name)
+        if profile is None:
+            return False
+        state = profile["storage_state"]
+        session = await context.get_session()
+        if state["cookies"]:
+            await session.context.add_cookies(state["cookies"])
+        if state["origins"]:
+            await session.context.add_init_script(_local_storage_script(state["origins"]))
+        logger.info(f"Restored session {name!r} ({len(state['cookies'])} cookie(s))")
+        return True
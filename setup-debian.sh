@@ -9,6 +9,7 @@ echo "Starting setup process..."
 echo "Installing system dependencies..."
 sudo apt update
 sudo apt install -y python3 python3-pip python3-venv
+# xvfb is only needed to run a visible browser on a server (BROWSER_HEADLESS=false)
 sudo apt-get install -y xvfb
 
 # 2. Create and activate virtual environment
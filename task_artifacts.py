@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def dir_size(path: Path) -> int:
+    """Bytes under path; files renamed or deleted during the walk are skipped"""
+    total = 0
+    # os.walk ignores directories that vanish mid-walk
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class TaskArtifacts:
+    """Private artifact directory of a single task: recording frames, history, log and timing"""
+
+    def __init__(self, task_id: str, path: Path):
+        self.task_id = task_id
+        self.path = path
+        self.frames_dir = path / "frames"
+        self.manifest_path = self.frames_dir / "manifest.json"
+        self.recording_path = path / "recording.gif"
+        self.history_path = path / "history.json"
+        self.metadata_path = path / "task.json"
+        self.log_path = path / "task.log"
+        self.frames_dir.mkdir(parents=True, exist_ok=True)
+        self._metadata: Dict[str, Any] = {"task_id": task_id, "log_file": self.log_path.name}
+        self._started = time.monotonic()
+
+    def frame_path(self, step: int, fmt: str) -> Path:
+        return self.frames_dir / f"frame_{step:03d}.{fmt}"
+
+    def recording(self) -> Optional[Path]:
+        """Path of the task's recording, if the agent produced one"""
+        return self.recording_path if self.recording_path.exists() else None
+
+    def save_history(self, history) -> None:
+        """Persist the agent history list as JSON"""
+        try:
+            history.save_to_file(self.history_path)
+        except Exception as e:
+            logger.error(f"Error saving history for task {self.task_id}: {str(e)}")
+
+    def start(self, **fields) -> None:
+        self._metadata.update(fields, status="running", started_at=datetime.now().isoformat())
+        self._write_metadata()
+
+    def finish(self, status: str, **fields) -> None:
+        """Record the final status and wall-clock timing of the task"""
+        self._metadata.update(
+            fields,
+            status=status,
+            finished_at=datetime.now().isoformat(),
+            duration_seconds=round(time.monotonic() - self._started, 3),
+            size_bytes=dir_size(self.path),
+        )
+        self._write_metadata()
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return dict(self._metadata)
+
+    def _write_metadata(self) -> None:
+        try:
+            self.metadata_path.write_text(json.dumps(self._metadata, indent=2, default=str))
+        except Exception as e:
+            logger.error(f"Error writing metadata for task {self.task_id}: {str(e)}")
+
+
+class ArtifactStore:
+    """Creates per-task artifact directories and evicts old ones by count and total size"""
+
+    def __init__(self, root: Optional[str] = None, max_tasks: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        self.root = Path(root or os.getenv("TASK_ARTIFACTS_DIR", "artifacts")).absolute()
+        self.max_tasks = max_tasks if max_tasks is not None else int(os.getenv("TASK_ARTIFACTS_MAX_TASKS", "50"))
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv("TASK_ARTIFACTS_MAX_MB", "500")) * 1024 * 1024)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._active: set = set()
+        # Sizes of finished task directories, so retention doesn't re-walk them every time
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def create(self, **metadata) -> TaskArtifacts:
+        """Allocate a fresh artifact directory for a new task"""
+        task_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._active.add(task_id)
+        artifacts = TaskArtifacts(task_id, self.root / task_id)
+        artifacts.start(**metadata)
+        self.enforce_retention()
+        return artifacts
+
+    def get(self, task_id: str) -> Optional[TaskArtifacts]:
+        path = self.root / task_id
+        return TaskArtifacts(task_id, path) if path.is_dir() else None
+
+    def release(self, artifacts: TaskArtifacts) -> None:
+        """Mark a task as finished so its directory becomes eligible for eviction"""
+        size = artifacts.metadata.get("size_bytes")
+        with self._lock:
+            self._active.discard(artifacts.task_id)
+            if size is not None:
+                self._sizes[artifacts.task_id] = size
+        self.enforce_retention()
+
+    def _size(self, path: Path) -> int:
+        size = self._sizes.get(path.name)
+        if size is None:
+            size = self._sizes[path.name] = dir_size(path)
+        return size
+
+    def enforce_retention(self) -> None:
+        """Delete the oldest finished task directories until count and size limits hold.
+
+        Running tasks count as empty until they are released. Errors are logged,
+        never raised, so retention can't fail the task that triggered it.
+        """
+        try:
+            self._enforce_retention()
+        except Exception as e:
+            logger.error(f"Error enforcing artifact retention: {str(e)}")
+
+    def _enforce_retention(self) -> None:
+        with self._lock:
+            entries = []
+            for path in self.root.iterdir():
+                try:
+                    if not path.is_dir():
+                        continue
+                    mtime = path.stat().st_mtime
+                except OSError:
+                    continue  # evicted or renamed meanwhile
+                size = 0 if path.name in self._active else self._size(path)
+                entries.append((mtime, path, size))
+            entries.sort()
+
+            count = len(entries)
+            total = sum(size for _, _, size in entries)
+            for _, path, size in entries:
+                if count <= self.max_tasks and total <= self.max_bytes:
+                    break
+                if path.name in self._active:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                self._sizes.pop(path.name, None)
+                count -= 1
+                total -= size
+                logger.info(f"Evicted task artifacts {path.name} ({size} bytes)")
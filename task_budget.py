@@ -0,0 +1,117 @@
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+# Messages starting with this carry a task's running usage totals
+USAGE_PREFIX = "💰 "
+
+
+def _env_number(name: str, cast=float):
+    value = os.getenv(name, "").strip()
+    return cast(value) if value else None
+
+
+class TaskBudget:
+    """Caps on a task's steps, tokens, estimated cost (USD) and wall time; None means unlimited"""
+
+    FIELDS = ("max_steps", "max_tokens", "max_cost", "max_seconds")
+
+    def __init__(self, max_steps: Optional[int] = None, max_tokens: Optional[int] = None,
+                 max_cost: Optional[float] = None, max_seconds: Optional[float] = None):
+        self.max_steps = max_steps
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_env(cls) -> "TaskBudget":
+        """Defaults from TASK_MAX_STEPS, TASK_MAX_TOKENS, TASK_MAX_COST and TASK_MAX_SECONDS"""
+        return cls(
+            max_steps=_env_number("TASK_MAX_STEPS", int),
+            max_tokens=_env_number("TASK_MAX_TOKENS", int),
+            max_cost=_env_number("TASK_MAX_COST"),
+            max_seconds=_env_number("TASK_MAX_SECONDS"),
+        )
+
+    @classmethod
+    def coerce(cls, budget) -> "TaskBudget":
+        """Accept a TaskBudget, a dict of caps (unset caps use the env defaults) or None"""
+        if isinstance(budget, TaskBudget):
+            return budget
+        merged = cls.from_env()
+        for field, value in (budget or {}).items():
+            if field not in cls.FIELDS:
+                raise ValueError(f"Unknown budget cap: {field}")
+            if value not in (None, ""):
+                setattr(merged, field, int(value) if field in ("max_steps", "max_tokens") else float(value))
+        return merged
+
+    @classmethod
+    def parse(cls, text: str) -> "TaskBudget":
+        """Parse terminal input such as "steps=30 cost=0.5 tokens=200000 minutes=10" """
+        caps: Dict[str, Any] = {}
+        for part in text.replace(",", " ").split():
+            name, _, value = part.partition("=")
+            name = name.strip().lower()
+            if name == "minutes":
+                caps["max_seconds"] = float(value) * 60
+            elif f"max_{name}" in cls.FIELDS:
+                caps[f"max_{name}"] = value
+            else:
+                raise ValueError(f"Unknown budget cap: {name}")
+        return cls.coerce(caps)
+
+    def exceeded(self, tokens: int, cost: float, started: float) -> Optional[str]:
+        """Reason the token, cost or time budget is used up, or None.
+
+        Steps are not checked here: agent.run(max_steps=...) enforces that cap.
+        """
+        if self.max_tokens is not None and tokens >= self.max_tokens:
+            return f"token limit of {self.max_tokens} reached ({tokens} used)"
+        if self.max_cost is not None and cost >= self.max_cost:
+            return f"cost limit of ${self.max_cost:.2f} reached (~${cost:.4f} spent)"
+        if self.max_seconds is not None and time.monotonic() - started >= self.max_seconds:
+            return f"time limit of {self.max_seconds:.0f}s reached"
+        return None
+
+    def steps_used_up(self, steps: int) -> Optional[str]:
+        """Reason a run that ended after this many completed steps hit the step cap, or None"""
+        if self.max_steps is not None and steps >= self.max_steps:
+            return f"step limit of {self.max_steps} reached"
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+
+    def __bool__(self) -> bool:
+        return bool(self.to_dict())
+
+
+def stop_between_steps(agent, check: Callable[[], Optional[str]], on_stop: Callable[[str], None]):
+    """Run check() after each of the agent's steps and call on_stop(reason) when it returns a reason.
+
+    Stopping from the new-step callback interrupts the step before its actions
+    run, which drops the step (and an LLM call already paid for). Here the step
+    has finished and is in the history; on_stop is expected to call
+    agent.stop(), which the run loop checks before starting the next step.
+    """
+    step = agent.step
+
+    async def checked_step(*args, **kwargs):
+        try:
+            return await step(*args, **kwargs)
+        finally:
+            reason = check()
+            if reason:
+                on_stop(reason)
+
+    agent.step = checked_step
+
+
+def format_usage(steps: int, input_tokens: int, output_tokens: int, cost: float,
+                 budget: Optional[TaskBudget] = None) -> str:
+    """One-line running total, e.g. "💰 Step 4 | 12.1k in / 0.6k out tokens | ~$0.0213 of $0.50" """
+    line = f"{USAGE_PREFIX}Step {steps} | {input_tokens / 1000:.1f}k in / {output_tokens / 1000:.1f}k out tokens | ~${cost:.4f}"
+    if budget and budget.max_cost is not None:
+        line += f" of ${budget.max_cost:.2f}"
+    return line
@@ -0,0 +1,316 @@
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+import threading
+import statistics
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# How often stream_task repeats ("queued", job) while a task waits, for position/ETA updates
+QUEUE_UPDATE_INTERVAL = 1.0
+
+
+class QueueFullError(RuntimeError):
+    """Raised by submit when max_queued tasks are already waiting"""
+
+
+class ScheduledTask:
+    """A task submitted to the scheduler, with its status and timing"""
+
+    def __init__(self, task: str, model_id: str, submitter: str, priority: int, seq: int,
+                 holder: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:8]
+        self.task = task
+        self.model_id = model_id
+        self.submitter = submitter
+        # Set when the task runs on a context held by this holder (see TaskScheduler.try_hold)
+        self.holder = holder
+        self.priority = priority
+        self.seq = seq
+        self.status = QUEUED
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.artifacts = None
+        self.handle: Optional[asyncio.Task] = None
+        # Created on the submitter's event loop
+        self.message_queue: asyncio.Queue = asyncio.Queue()
+        self.screenshot_queue: asyncio.Queue = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self._admitted: asyncio.Future = self._loop.create_future()
+
+    @property
+    def queue_wait(self) -> float:
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def run_time(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "task": self.task,
+            "model_id": self.model_id,
+            "submitter": self.submitter,
+            "priority": self.priority,
+            "status": self.status,
+            "queue_wait": round(self.queue_wait, 3),
+            "run_time": None if self.run_time is None else round(self.run_time, 3),
+            "error": self.error,
+        }
+
+
+class TaskScheduler:
+    """In-process scheduler shared by the terminal and Gradio front ends.
+
+    Tasks wait in a priority queue until a slot is free. At most max_running
+    tasks run at once, each model is capped by model_limits, and among tasks
+    of equal priority the submitter with the fewest running tasks (then the
+    one served least recently) goes first. Submitting and admission are
+    thread-safe, so front ends on different event loops share one scheduler;
+    every task runs on its submitter's loop through BrowserAutomation.run_task.
+    With max_queued, submitting while that many tasks wait raises
+    QueueFullError instead of growing the queue.
+
+    Front ends that keep a context between tasks (web UI sessions) reserve a
+    slot with try_hold() and return it with unhold(); a held slot counts as
+    running, and tasks submitted with that holder run in it without queueing
+    for another one.
+    """
+
+    def __init__(self, automation, max_running: Optional[int] = None,
+                 model_limits: Optional[Dict[str, int]] = None, history_size: int = 200,
+                 max_queued: Optional[int] = None):
+        self.automation = automation
+        self.max_running = max_running or automation.pool.max_contexts
+        self.max_queued = max_queued
+        self.model_limits = model_limits or {}
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiting: List[ScheduledTask] = []
+        self._running: Dict[str, ScheduledTask] = {}
+        self._jobs: "OrderedDict[str, ScheduledTask]" = OrderedDict()
+        self._last_served: Dict[str, float] = {}
+        self._held: Set[str] = set()
+
+    def submit(self, task: str, model_id: str, submitter: str = "terminal", priority: int = 0,
+               holder: Optional[str] = None, **run_kwargs) -> ScheduledTask:
+        """Queue a task; must be called from a running event loop, where the task will run"""
+        job = ScheduledTask(task, model_id, submitter, priority, next(self._seq), holder)
+        with self._lock:
+            if self.max_queued and len(self._waiting) >= self.max_queued:
+                raise QueueFullError(f"{len(self._waiting)} tasks are already waiting; try again later")
+            self._waiting.append(job)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_size:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status in (QUEUED, RUNNING):
+                    break
+                del self._jobs[oldest_id]
+            self._dispatch_locked()
+        job.handle = asyncio.create_task(self._run(job, run_kwargs))
+        return job
+
+    def _sort_key(self, job: ScheduledTask):
+        running_for_submitter = sum(1 for j in self._running.values() if j.submitter == job.submitter)
+        return (-job.priority, running_for_submitter, self._last_served.get(job.submitter, 0.0), job.seq)
+
+    def _eligible(self, job: ScheduledTask) -> bool:
+        limit = self.model_limits.get(job.model_id)
+        if not limit:
+            return True
+        return sum(1 for j in self._running.values() if j.model_id == job.model_id) < limit
+
+    def _slots_in_use_locked(self) -> int:
+        """Held slots plus running tasks that are not using one of them"""
+        return len(self._held) + sum(1 for j in self._running.values() if j.holder not in self._held)
+
+    def _dispatch_locked(self):
+        """Admit waiting tasks while slots are free; caller holds the lock"""
+        while True:
+            free = self._slots_in_use_locked() < self.max_running
+            candidates = sorted((j for j in self._waiting if self._eligible(j) and (free or j.holder in self._held)),
+                                key=self._sort_key)
+            if not candidates:
+                return
+            job = candidates[0]
+            self._waiting.remove(job)
+            self._running[job.id] = job
+            job.status = RUNNING
+            self._last_served[job.submitter] = time.monotonic()
+            job._loop.call_soon_threadsafe(self._admit, job)
+
+    @staticmethod
+    def _admit(job: ScheduledTask):
+        if not job._admitted.done():
+            job._admitted.set_result(None)
+
+    async def _run(self, job: ScheduledTask, run_kwargs: Dict[str, Any]):
+        try:
+            await job._admitted
+            job.started_at = time.monotonic()
+            logger.info(f"Task {job.id} from {job.submitter} started after {job.queue_wait:.2f}s in queue")
+            job.artifacts = await self.automation.run_task(
+                job.task, job.model_id,
+                message_queue=job.message_queue,
+                screenshot_queue=job.screenshot_queue,
+                **run_kwargs,
+            )
+            job.status = DONE
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            job.exception = e
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                if job in self._waiting:
+                    self._waiting.remove(job)
+                self._running.pop(job.id, None)
+                self._dispatch_locked()
+
+    def try_hold(self, holder: str) -> bool:
+        """Reserve a slot for holder if one is free (or already held); False if all slots are taken"""
+        with self._lock:
+            if holder in self._held:
+                return True
+            if self._slots_in_use_locked() >= self.max_running:
+                return False
+            self._held.add(holder)
+            return True
+
+    def unhold(self, holder: str):
+        """Return holder's slot and admit waiting tasks"""
+        with self._lock:
+            self._held.discard(holder)
+            self._dispatch_locked()
+
+    def waiting_for_slot(self) -> int:
+        """Queued tasks that need a free slot, i.e. not submitted by a holder"""
+        with self._lock:
+            return sum(1 for j in self._waiting if j.holder not in self._held)
+
+    def position(self, job: ScheduledTask) -> Optional[int]:
+        """1-based position of a queued task in admission order, or None if it is not waiting"""
+        with self._lock:
+            order = sorted(self._waiting, key=self._sort_key)
+        return order.index(job) + 1 if job in order else None
+
+    def estimated_wait(self, job: ScheduledTask) -> Optional[float]:
+        """Rough seconds until a queued task starts, from recent run times"""
+        position = self.position(job)
+        if position is None:
+            return None
+        run_times = [j.run_time for j in self.jobs() if j.status == DONE and j.run_time is not None]
+        if not run_times:
+            return None
+        average = statistics.mean(run_times[-20:])
+        return average * ((position - 1) // self.max_running + 1)
+
+    def describe_position(self, job: ScheduledTask) -> Optional[str]:
+        """e.g. "Queued at position 3 of 5 (about 2 min)", or None once the task has started"""
+        position = self.position(job)
+        if position is None:
+            return None
+        with self._lock:
+            waiting = len(self._waiting)
+        text = f"Queued at position {position} of {waiting}"
+        wait = self.estimated_wait(job)
+        if wait is not None:
+            text += f" (about {wait / 60:.0f} min)" if wait >= 90 else f" (about {wait:.0f}s)"
+        return text
+
+    async def stream_task(self, task: str, model_id: str, submitter: str = "terminal", priority: int = 0,
+                          **run_kwargs):
+        """Submit a task and yield ("queued", job), ("message", text), ("screenshot", path) and
+        finally ("artifacts", TaskArtifacts); errors are re-raised after all updates are yielded.
+        ("queued", job) is repeated every QUEUE_UPDATE_INTERVAL seconds while the task waits."""
+        job = self.submit(task, model_id, submitter=submitter, priority=priority, **run_kwargs)
+        yield "queued", job
+        last_queued = time.monotonic()
+
+        try:
+            while True:
+                if job.status == QUEUED and time.monotonic() - last_queued >= QUEUE_UPDATE_INTERVAL:
+                    yield "queued", job
+                    last_queued = time.monotonic()
+                # Check completion before draining so no update put before the end is missed
+                finished = job.handle.done()
+                while not job.message_queue.empty():
+                    yield "message", job.message_queue.get_nowait()
+                while not job.screenshot_queue.empty():
+                    yield "screenshot", job.screenshot_queue.get_nowait()
+                if finished:
+                    break
+                await asyncio.wait({job.handle}, timeout=0.2)
+        finally:
+            if not job.handle.done():
+                job.handle.cancel()
+
+        if job.exception is not None:
+            raise job.exception
+        if job.status == CANCELLED:
+            raise asyncio.CancelledError()
+        yield "artifacts", job.artifacts
+
+    def jobs(self) -> List[ScheduledTask]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, job_id: str) -> Optional[ScheduledTask]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Task counts by status plus queue-wait and run-time statistics"""
+        jobs = self.jobs()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        for job in jobs:
+            counts[job.status] += 1
+
+        def summary(values: List[float]) -> Dict[str, float]:
+            if not values:
+                return {}
+            values = sorted(values)
+            return {
+                "avg": round(statistics.mean(values), 3),
+                "p50": round(values[len(values) // 2], 3),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                "max": round(values[-1], 3),
+            }
+
+        started = [job for job in jobs if job.started_at is not None]
+        finished = [job for job in started if job.finished_at is not None]
+        return {
+            "counts": counts,
+            "max_running": self.max_running,
+            "queue_wait": summary([job.queue_wait for job in started]),
+            "run_time": summary([job.run_time for job in finished]),
+        }
+
+    def metric_samples(self) -> List[str]:
+        """Task counts by status as Prometheus gauge lines, for metrics.register_collector"""
+        counts = self.metrics()["counts"]
+        lines = ["# HELP browser_agent_scheduler_tasks Tasks known to the scheduler by status",
+                 "# TYPE browser_agent_scheduler_tasks gauge"]
+        lines.extend(f'browser_agent_scheduler_tasks{{status="{status}"}} {count}' for status, count in counts.items())
+        return lines
@@ -0,0 +1,68 @@
+import asyncio
+
+from task_budget import TaskBudget, stop_between_steps
+
+
+class FakeAgent:
+    """Mirrors browser-use's Agent.run/step control flow with a fake LLM that never says done"""
+
+    def __init__(self, on_new_step, tokens_per_step=100):
+        self.n_steps = 1
+        self.stopped = False
+        self.history = []
+        self.tokens = 0
+        self.tokens_per_step = tokens_per_step
+        self.on_new_step = on_new_step
+
+    def stop(self):
+        self.stopped = True
+
+    async def step(self):
+        try:
+            self.tokens += self.tokens_per_step  # the LLM call
+            self.n_steps += 1
+            await self.on_new_step(self.n_steps)
+            if self.stopped:
+                raise InterruptedError
+            result = f"actions of step {self.n_steps - 1}"
+        except InterruptedError:
+            result = None
+        self.history.append(result)
+
+    async def run(self, max_steps):
+        for _ in range(max_steps):
+            if self.stopped:
+                break
+            await self.step()
+        return self.history
+
+
+def run_agent(budget, tokens_per_step=100, max_steps=50):
+    reasons = []
+    agent = FakeAgent(on_new_step=lambda n_steps: asyncio.sleep(0), tokens_per_step=tokens_per_step)
+
+    def on_stop(reason):
+        reasons.append(reason)
+        agent.stop()
+
+    stop_between_steps(agent, lambda: budget.exceeded(agent.tokens, 0.0, float("inf")), on_stop)
+    history = asyncio.run(agent.run(max_steps=budget.max_steps or max_steps))
+    return history, reasons
+
+
+def test_step_cap_runs_exactly_max_steps():
+    history, reasons = run_agent(TaskBudget(max_steps=3))
+    assert history == ["actions of step 1", "actions of step 2", "actions of step 3"]
+    assert reasons == []
+    assert TaskBudget(max_steps=3).steps_used_up(len(history)) == "step limit of 3 reached"
+
+
+def test_token_cap_keeps_the_step_that_crossed_it():
+    history, reasons = run_agent(TaskBudget(max_tokens=250))
+    assert history == ["actions of step 1", "actions of step 2", "actions of step 3"]
+    assert reasons == ["token limit of 250 reached (300 used)"]
+
+
+def test_steps_used_up_without_cap():
+    assert TaskBudget().steps_used_up(100) is None
+    assert TaskBudget(max_steps=5).steps_used_up(4) is None
@@ -0,0 +1,411 @@
+"""
+File upload actions that find the page's file input themselves.
+
+Instead of the agent guessing element indices (one LLM step per guess), the
+action tries, in order: the element index the agent passed (if any), the
+selector that worked before on the same URL pattern, and finally one DOM
+pass over every frame that lists all file inputs and picks the best match for
+the file being uploaded. The selector that worked is cached for later runs.
+
+Files are always passed to Playwright as paths, never as in-memory buffers, so
+large files are not copied through the driver connection. A path upload action
+takes a file, directory or glob under UPLOAD_DIR and reports per-file progress.
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import logging
+import mimetypes
+import threading
+from pathlib import Path
+from contextvars import ContextVar
+from urllib.parse import urlparse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from browser_use import ActionResult, Controller
+
+logger = logging.getLogger(__name__)
+
+SELECTOR_CACHE_PATH = os.getenv("UPLOAD_SELECTOR_CACHE", ".upload_selectors.json")
+
+# Agent-chosen upload paths must be inside this directory
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "50"))
+# Timeout for handing a file to the browser: a floor plus time per MB
+UPLOAD_MIN_TIMEOUT = 30
+UPLOAD_SECONDS_PER_MB = float(os.getenv("UPLOAD_SECONDS_PER_MB", "0.5"))
+
+# Set by the task runner to a callable that puts progress lines on the task's message queue
+upload_progress: ContextVar[Optional[Callable[[str], None]]] = ContextVar("upload_progress", default=None)
+
+# Words in an input's id, name, label or surrounding text that suggest it takes documents
+UPLOAD_HINTS = ("upload", "file", "attach", "resume", "cv", "document", "pdf", "drop")
+
+# Runs in the page: every <input type=file> (including open shadow roots) with a stable selector
+_FIND_FILE_INPUTS_JS = """
+() => {
+    const selectorFor = (el) => {
+        if (el.id && document.querySelectorAll('#' + CSS.escape(el.id)).length === 1) {
+            return '#' + CSS.escape(el.id);
+        }
+        if (el.name) {
+            const byName = 'input[type="file"][name="' + el.name.replace(/"/g, '\\\\"') + '"]';
+            if (document.querySelectorAll(byName).length === 1) return byName;
+        }
+        const parts = [];
+        for (let node = el; node && node.nodeType === 1 && node !== document.body; node = node.parentElement) {
+            let index = 1;
+            for (let sib = node.previousElementSibling; sib; sib = sib.previousElementSibling) {
+                if (sib.tagName === node.tagName) index++;
+            }
+            parts.unshift(node.tagName.toLowerCase() + ':nth-of-type(' + index + ')');
+        }
+        return 'body > ' + parts.join(' > ');
+    };
+    const labelFor = (el) => {
+        const texts = [];
+        if (el.labels) for (const label of el.labels) texts.push(label.innerText);
+        for (const attr of ['aria-label', 'title', 'placeholder', 'data-testid']) {
+            if (el.getAttribute(attr)) texts.push(el.getAttribute(attr));
+        }
+        const container = el.closest('form, label, [class*="upload"], [class*="drop"], div');
+        if (container) texts.push((container.innerText || '').slice(0, 200));
+        return texts.join(' ');
+    };
+    const inputs = [];
+    const collect = (root) => {
+        for (const el of root.querySelectorAll('input[type="file"]')) inputs.push(el);
+        for (const host of root.querySelectorAll('*')) if (host.shadowRoot) collect(host.shadowRoot);
+    };
+    collect(document);
+    return inputs.map((el, position) => {
+        const rect = el.getBoundingClientRect();
+        const style = window.getComputedStyle(el);
+        return {
+            position,
+            selector: el.getRootNode() === document ? selectorFor(el) : null,
+            id: el.id || '',
+            name: el.name || '',
+            accept: el.accept || '',
+            multiple: el.multiple,
+            disabled: el.disabled,
+            visible: rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none',
+            label: labelFor(el),
+        };
+    });
+}
+"""
+
+
+def url_pattern(url: str) -> str:
+    """host/path with segments holding digits or long ids replaced by *, e.g. jobs.example.com/apply/*"""
+    parsed = urlparse(url)
+    segments = []
+    for segment in parsed.path.strip("/").split("/"):
+        if not segment:
+            continue
+        if re.search(r"\d", segment) or len(segment) > 24:
+            segment = "*"
+        segments.append(segment)
+    return "/".join([parsed.hostname or "", *segments])
+
+
+class SelectorCache:
+    """Resolved file-input selectors per URL pattern, persisted as JSON"""
+
+    def __init__(self, path: str = SELECTOR_CACHE_PATH, max_per_key: int = 3):
+        self.path = Path(path)
+        self.max_per_key = max_per_key
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List[str]]] = None
+
+    def _load(self) -> Dict[str, List[str]]:
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, url: str) -> List[str]:
+        """Cached selectors for the URL's pattern, most recently used first"""
+        with self._lock:
+            return list(self._load().get(url_pattern(url), []))
+
+    def remember(self, url: str, selector: str):
+        pattern = url_pattern(url)
+        with self._lock:
+            entries = self._load()
+            selectors = [selector] + [s for s in entries.get(pattern, []) if s != selector]
+            entries[pattern] = selectors[:self.max_per_key]
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(entries, indent=2))
+            os.replace(tmp_path, self.path)
+
+
+selector_cache = SelectorCache()
+
+
+def _accepts(accept: List[str], path: str) -> bool:
+    """Whether an input's accept list (extensions and MIME types) allows path"""
+    extension = Path(path).suffix.lower()
+    mime_type = mimetypes.guess_type(path)[0] or ""
+    for pattern in accept:
+        if pattern in ("*", "*/*") or pattern == extension or pattern == mime_type:
+            return True
+        if pattern.endswith("/*") and mime_type.startswith(pattern[:-1]):
+            return True
+    return False
+
+
+def score_candidate(candidate: Dict[str, Any], paths: List[str]) -> float:
+    """How likely a file input is the right one for paths; disabled or incompatible inputs score below 0"""
+    if candidate["disabled"]:
+        return -10.0
+    score = 0.0
+    accept = [a.strip().lower() for a in candidate["accept"].split(",") if a.strip()]
+    if accept:
+        # An image-only input will reject a PDF
+        score += 3 if all(_accepts(accept, p) for p in paths) else -5
+    if len(paths) > 1 and candidate["multiple"]:
+        # Other inputs still work, one file at a time
+        score += 2
+    text = f"{candidate['id']} {candidate['name']} {candidate['label']}".lower()
+    score += sum(1 for hint in UPLOAD_HINTS if hint in text)
+    if candidate["visible"]:
+        score += 0.5
+    if candidate["selector"] is None:
+        # Inside a shadow root: usable now, but not cacheable
+        score -= 0.5
+    return score
+
+
+async def find_file_inputs(page) -> List[Tuple[Any, Dict[str, Any]]]:
+    """(frame, candidate) for every file input in every frame of the page, in one pass per frame"""
+    found = []
+    for frame in page.frames:
+        try:
+            candidates = await frame.evaluate(_FIND_FILE_INPUTS_JS)
+        except Exception as e:
+            # Detached or cross-origin frames that can't be scripted
+            logger.debug(f"Skipping frame {frame.url}: {str(e)}")
+            continue
+        found.extend((frame, candidate) for candidate in candidates)
+    return found
+
+
+async def _element_for(frame, candidate: Dict[str, Any]):
+    if candidate["selector"]:
+        return await frame.query_selector(candidate["selector"])
+    # Shadow DOM inputs are reached through Playwright's piercing locator by position
+    handles = await frame.query_selector_all('input[type="file"]')
+    return handles[candidate["position"]] if candidate["position"] < len(handles) else None
+
+
+async def _from_cache(page, url: str, paths: List[str]):
+    """First cached selector that still finds an enabled file input accepting paths"""
+    for selector in selector_cache.lookup(url):
+        for frame in page.frames:
+            try:
+                element = await frame.query_selector(selector)
+                if element is None:
+                    continue
+                found = await element.evaluate(
+                    "el => ({file: el.type === 'file', disabled: el.disabled, accept: el.accept || ''})")
+            except Exception:
+                continue
+            accept = [a.strip().lower() for a in found["accept"].split(",") if a.strip()]
+            if found["file"] and not found["disabled"] and (not accept or all(_accepts(accept, p) for p in paths)):
+                return element, selector
+    return None, None
+
+
+async def _from_index(browser, index: int):
+    dom_el = await browser.get_dom_element_by_index(index)
+    if dom_el is None:
+        return None
+    file_upload_dom_el = dom_el.get_file_upload_element()
+    if file_upload_dom_el is None:
+        return None
+    return await browser.get_locate_element(file_upload_dom_el)
+
+
+async def resolve_file_input(browser, paths: List[str], index: Optional[int] = None):
+    """Find the best file input on the current page; returns (element, selector, how) or (None, None, reason)"""
+    page = await browser.get_current_page()
+
+    # An explicit index from the agent wins over anything remembered from earlier runs
+    if index is not None:
+        try:
+            element = await _from_index(browser, index)
+        except Exception as e:
+            logger.debug(f"Index {index} did not resolve to a file input: {str(e)}")
+            element = None
+        if element:
+            selector = await element.evaluate(
+                "el => el.id ? '#' + CSS.escape(el.id) : (el.name ? `input[type=\"file\"][name=\"${el.name}\"]` : null)")
+            return element, selector, f"index {index}"
+
+    element, selector = await _from_cache(page, page.url, paths)
+    if element:
+        return element, selector, "cached selector"
+
+    candidates = await find_file_inputs(page)
+    if not candidates:
+        return None, None, "No file input found on the page"
+    ranked = sorted(candidates, key=lambda fc: score_candidate(fc[1], paths), reverse=True)
+    frame, best = ranked[0]
+    if score_candidate(best, paths) < 0:
+        return None, None, f"None of the {len(candidates)} file input(s) accepts {', '.join(Path(p).name for p in paths)}"
+    logger.info(f"Picked file input {best['selector'] or '#' + str(best['position'])} "
+                f"out of {len(candidates)} candidate(s)")
+    return await _element_for(frame, best), best["selector"], "page scan"
+
+
+def expand_upload_paths(spec: str, root: str = UPLOAD_DIR) -> List[Path]:
+    """Files named by spec (a file, a directory or a glob) relative to root; raises ValueError outside root"""
+    root_path = Path(root).resolve()
+    pattern = spec if os.path.isabs(spec) else str(root_path / spec)
+    if glob.has_magic(pattern):
+        matches = [Path(p) for p in sorted(glob.glob(pattern, recursive=True))]
+    elif os.path.isdir(pattern):
+        matches = sorted(p for p in Path(pattern).rglob("*"))
+    else:
+        matches = [Path(pattern)]
+
+    files = []
+    for match in matches:
+        resolved = match.resolve()
+        if resolved != root_path and root_path not in resolved.parents:
+            raise ValueError(f"{spec} is outside the upload directory {root}")
+        if resolved.is_file():
+            files.append(resolved)
+    if len(files) > UPLOAD_MAX_FILES:
+        raise ValueError(f"{spec} matches {len(files)} files; at most {UPLOAD_MAX_FILES} can be uploaded at once")
+    return files
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def _timeout_ms(size: int) -> float:
+    """set_input_files timeout that grows with the amount of data handed to the browser"""
+    return (UPLOAD_MIN_TIMEOUT + UPLOAD_SECONDS_PER_MB * size / (1024 * 1024)) * 1000
+
+
+def _report(message: str):
+    logger.info(message)
+    progress = upload_progress.get()
+    if progress is not None:
+        progress(message)
+
+
+async def _set_files(browser, element, selector, paths: List[str]):
+    """Set paths on element; returns the selector to cache"""
+    size = sum(os.path.getsize(p) for p in paths)
+    # Paths, not file contents: Playwright hands local paths to the browser (or streams
+    # them in chunks to a remote one) instead of buffering the bytes through its channel
+    await element.set_input_files(paths if len(paths) > 1 else paths[0], timeout=_timeout_ms(size))
+    page = await browser.get_current_page()
+    if selector:
+        selector_cache.remember(page.url, selector)
+
+
+async def upload_files(browser, paths: List[str], index: Optional[int] = None) -> ActionResult:
+    """Resolve the file input and set paths on it, caching the selector on success.
+
+    Several files go to a multiple input in one call, otherwise one at a time
+    (re-resolving the input, as sites often replace it after a file is picked).
+    Each file's progress is logged and sent to upload_progress; files set in
+    one call are reported one by one before and after it, with the call's
+    shared time, since the browser doesn't report them separately.
+    """
+    missing = [p for p in paths if not Path(p).exists()]
+    if missing:
+        return ActionResult(error=f"File not found: {', '.join(missing)}")
+    if not paths:
+        return ActionResult(error="No files to upload")
+
+    started = time.perf_counter()
+    element, selector, how = await resolve_file_input(browser, paths, index)
+    if element is None:
+        logger.info(how)
+        return ActionResult(error=how)
+
+    names = ", ".join(Path(p).name for p in paths)
+    total_size = sum(os.path.getsize(p) for p in paths)
+
+    def report_start(number: int, path: str):
+        _report(f"📤 Uploading {number}/{len(paths)}: {Path(path).name} ({_format_size(os.path.getsize(path))})")
+
+    try:
+        if len(paths) == 1 or await element.evaluate("el => el.multiple"):
+            for number, path in enumerate(paths, start=1):
+                report_start(number, path)
+            set_started = time.perf_counter()
+            await _set_files(browser, element, selector, paths)
+            elapsed = time.perf_counter() - set_started
+            for path in paths:
+                _report(f"  ✓ {Path(path).name} in {elapsed:.1f}s")
+        else:
+            for number, path in enumerate(paths, start=1):
+                if number > 1:
+                    element, selector, how = await resolve_file_input(browser, [path], index)
+                    if element is None:
+                        raise RuntimeError(how)
+                file_started = time.perf_counter()
+                report_start(number, path)
+                await _set_files(browser, element, selector, [path])
+                _report(f"  ✓ {Path(path).name} in {time.perf_counter() - file_started:.1f}s")
+    except Exception as e:
+        logger.debug(f"Error in set_input_files: {str(e)}")
+        return ActionResult(error=f"Failed to upload file: {str(e)}")
+
+    msg = (f"Successfully uploaded {names} ({_format_size(total_size)}, file input found by {how} "
+           f"in {time.perf_counter() - started:.2f}s)")
+    _report(msg)
+    return ActionResult(extracted_content=msg, include_in_memory=True)
+
+
+def register_upload_action(controller, description: str, paths: Callable[[], List[str]]):
+    """Add an upload action to controller; the agent may pass the index of the upload button as a hint"""
+
+    @controller.action(description)
+    async def upload_file(browser, index: Optional[int] = None):
+        return await upload_files(browser, [str(Path(p).absolute()) for p in paths()], index)
+
+    return upload_file
+
+
+def register_path_upload_action(controller, root: str = UPLOAD_DIR):
+    """Add an action that uploads a file, directory or glob under root, e.g. "reports/*.pdf" """
+
+    @controller.action(
+        f"Upload files - path is a file, directory or glob inside the {root} directory; "
+        "optionally pass the index of the upload button"
+    )
+    async def upload_path(path: str, browser, index: Optional[int] = None):
+        try:
+            files = expand_upload_paths(path, root)
+        except ValueError as e:
+            return ActionResult(error=str(e))
+        if not files:
+            return ActionResult(error=f"No files match {path} in {root}")
+        return await upload_files(browser, [str(f) for f in files], index)
+
+    return upload_path
+
+
+def build_controller(root: str = UPLOAD_DIR) -> Controller:
+    """Controller with the default browser actions plus the path upload action"""
+    controller = Controller()
+    register_path_upload_action(controller, root)
+    return controller
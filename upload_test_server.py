@@ -0,0 +1,76 @@
+"""
+Local stand-in upload page for trying the upload actions without a real site.
+
+Serves a form with a multi-file document input (plus an image-only decoy input)
+and streams posted files to disk. Multipart bodies are spooled to temporary
+files by Werkzeug and copied in chunks, so files of any size can be posted.
+
+Usage:
+    python upload_test_server.py --port 8765 --dir received
+    # then run a task such as:
+    # "Go to http://localhost:8765, upload reports/*.pdf and click Send"
+"""
+
+import os
+import time
+import argparse
+from pathlib import Path
+
+from flask import Flask, request, render_template_string
+from werkzeug.utils import secure_filename
+
+app = Flask(__name__)
+# No limit on the request size: large files are the point
+app.config["MAX_CONTENT_LENGTH"] = None
+
+PAGE = """
+<!doctype html>
+<title>Upload test</title>
+<h1>Upload documents</h1>
+<form method="post" action="/upload" enctype="multipart/form-data">
+  <p><label>Profile picture <input type="file" name="avatar" accept="image/*"></label></p>
+  <p><label for="documents">Documents</label>
+     <input type="file" id="documents" name="documents" multiple accept=".pdf,.zip,.txt,.csv,application/*"></p>
+  <p><button type="submit">Send</button></p>
+</form>
+{% if received %}
+<h2>Received</h2>
+<ul>
+{% for name, size, seconds in received %}<li>{{ name }}: {{ size }} bytes in {{ "%.1f"|format(seconds) }}s</li>{% endfor %}
+</ul>
+{% endif %}
+"""
+
+
+@app.route("/")
+def index():
+    return render_template_string(PAGE, received=None)
+
+
+@app.route("/upload", methods=["POST"])
+def upload():
+    received = []
+    for storage in request.files.getlist("documents"):
+        if not storage.filename:
+            continue
+        started = time.monotonic()
+        target = Path(app.config["UPLOAD_TARGET"]) / secure_filename(storage.filename)
+        storage.save(target, buffer_size=1024 * 1024)
+        received.append((target.name, target.stat().st_size, time.monotonic() - started))
+        app.logger.info(f"Received {target.name} ({target.stat().st_size} bytes)")
+    return render_template_string(PAGE, received=received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in page for testing file uploads")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dir", default="received", help="Directory uploaded files are written to")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    app.config["UPLOAD_TARGET"] = args.dir
+    app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()